@@ -0,0 +1,134 @@
+import os
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    return value.lower() in ("1", "true", "yes") if value else default
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Application settings, read from the environment once at import."""
+
+    mongo_uri: str | None
+    mongo_db_name: str
+    mongo_max_pool_size: int
+    mongo_min_pool_size: int
+    mongo_max_idle_time_ms: int
+    mongo_connect_timeout_ms: int
+    mongo_server_selection_timeout_ms: int
+    mongo_socket_timeout_ms: int
+    mongo_wait_queue_timeout_ms: int
+    jwt_secret_key: str | None
+    cloudinary_cloud_name: str | None
+    cloudinary_api_key: str | None
+    cloudinary_api_secret: str | None
+    bcrypt_rounds: int
+    hash_executor: str
+    hash_workers: int
+    hash_max_pending: int
+    max_prescription_bytes: int
+    upload_spool_bytes: int
+    upload_chunk_bytes: int
+    max_image_bytes: int
+    image_max_dimension: int
+    image_quality: int
+    history_batch_size: int
+    history_flush_seconds: int
+    history_buffer_size: int
+    history_retention_days: int
+    history_per_user: int
+    trending_capacity: int
+    trending_flush_seconds: int
+    trending_window_minutes: int
+    inbox_change_streams: bool
+    sse_heartbeat_seconds: int
+    cascade_batch_size: int
+    search_cache_size: int
+    search_cache_ttl_seconds: int
+    cache_version_store: str
+    cache_version_refresh_ms: int
+    catalog_read_preference: str
+    catalog_max_staleness_seconds: int
+    sync_tombstone_days: int
+    price_stats_flush_seconds: int
+    price_stats_offers: int
+    low_stock_threshold: int
+    low_stock_scan_seconds: int
+    low_stock_batch_size: int
+    idempotency_ttl_hours: int
+    idempotency_cache_size: int
+    name_index_sync_seconds: int
+    name_index_rebuild_hours: int
+
+    @classmethod
+    def from_env(cls):
+        load_dotenv()
+        return cls(
+            mongo_uri=os.getenv("MONGO_URI"),
+            mongo_db_name=os.getenv("MONGO_DB_NAME", "medi_find_db"),
+            mongo_max_pool_size=_env_int("MONGO_MAX_POOL_SIZE", 50),
+            mongo_min_pool_size=_env_int("MONGO_MIN_POOL_SIZE", 5),
+            mongo_max_idle_time_ms=_env_int("MONGO_MAX_IDLE_TIME_MS", 300_000),
+            mongo_connect_timeout_ms=_env_int("MONGO_CONNECT_TIMEOUT_MS", 5_000),
+            mongo_server_selection_timeout_ms=_env_int(
+                "MONGO_SERVER_SELECTION_TIMEOUT_MS", 5_000
+            ),
+            mongo_socket_timeout_ms=_env_int("MONGO_SOCKET_TIMEOUT_MS", 20_000),
+            mongo_wait_queue_timeout_ms=_env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2_000),
+            jwt_secret_key=os.getenv("JWT_SECRET_KEY"),
+            cloudinary_cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+            cloudinary_api_key=os.getenv("CLOUDINARY_API_KEY"),
+            cloudinary_api_secret=os.getenv("CLOUDINARY_API_SECRET"),
+            bcrypt_rounds=_env_int("BCRYPT_ROUNDS", 12),
+            hash_executor=os.getenv("HASH_EXECUTOR", "thread"),
+            hash_workers=_env_int("HASH_WORKERS", 2),
+            hash_max_pending=_env_int("HASH_MAX_PENDING", 32),
+            max_prescription_bytes=_env_int("MAX_PRESCRIPTION_BYTES", 10_000_000),
+            upload_spool_bytes=_env_int("UPLOAD_SPOOL_BYTES", 1_000_000),
+            upload_chunk_bytes=_env_int("UPLOAD_CHUNK_BYTES", 6_000_000),
+            max_image_bytes=_env_int("MAX_IMAGE_BYTES", 15_000_000),
+            image_max_dimension=_env_int("IMAGE_MAX_DIMENSION", 1600),
+            image_quality=_env_int("IMAGE_QUALITY", 82),
+            history_batch_size=_env_int("HISTORY_BATCH_SIZE", 100),
+            history_flush_seconds=_env_int("HISTORY_FLUSH_SECONDS", 5),
+            history_buffer_size=_env_int("HISTORY_BUFFER_SIZE", 10_000),
+            history_retention_days=_env_int("HISTORY_RETENTION_DAYS", 90),
+            history_per_user=_env_int("HISTORY_PER_USER", 200),
+            trending_capacity=_env_int("TRENDING_CAPACITY", 500),
+            trending_flush_seconds=_env_int("TRENDING_FLUSH_SECONDS", 60),
+            trending_window_minutes=_env_int("TRENDING_WINDOW_MINUTES", 60),
+            inbox_change_streams=_env_bool("INBOX_CHANGE_STREAMS", False),
+            sse_heartbeat_seconds=_env_int("SSE_HEARTBEAT_SECONDS", 15),
+            cascade_batch_size=_env_int("CASCADE_BATCH_SIZE", 500),
+            search_cache_size=_env_int("SEARCH_CACHE_SIZE", 1000),
+            search_cache_ttl_seconds=_env_int("SEARCH_CACHE_TTL_SECONDS", 60),
+            cache_version_store=os.getenv("CACHE_VERSION_STORE", "local"),
+            cache_version_refresh_ms=_env_int("CACHE_VERSION_REFRESH_MS", 500),
+            catalog_read_preference=os.getenv(
+                "CATALOG_READ_PREFERENCE", "secondaryPreferred"
+            ),
+            catalog_max_staleness_seconds=_env_int(
+                "CATALOG_MAX_STALENESS_SECONDS", -1
+            ),
+            sync_tombstone_days=_env_int("SYNC_TOMBSTONE_DAYS", 30),
+            price_stats_flush_seconds=_env_int("PRICE_STATS_FLUSH_SECONDS", 30),
+            price_stats_offers=_env_int("PRICE_STATS_OFFERS", 5),
+            low_stock_threshold=_env_int("LOW_STOCK_THRESHOLD", 5),
+            low_stock_scan_seconds=_env_int("LOW_STOCK_SCAN_SECONDS", 60),
+            low_stock_batch_size=_env_int("LOW_STOCK_BATCH_SIZE", 500),
+            idempotency_ttl_hours=_env_int("IDEMPOTENCY_TTL_HOURS", 24),
+            idempotency_cache_size=_env_int("IDEMPOTENCY_CACHE_SIZE", 1000),
+            name_index_sync_seconds=_env_int("NAME_INDEX_SYNC_SECONDS", 5),
+            name_index_rebuild_hours=_env_int("NAME_INDEX_REBUILD_HOURS", 24),
+        )
+
+
+settings = Settings.from_env()
@@ -1,16 +1,30 @@
-from pymongo import MongoClient
-import os
-from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, MongoClient, ReadPreference
+from pymongo.read_preferences import (
+    Nearest,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+from config import settings
 
 
-load_dotenv()
-
-# Connect to Mongo Atlas Cluster
-mongo_client = MongoClient(os.getenv("MONGO_URI"))
+# Create the Mongo Atlas client without connecting; the pool is opened
+# and warmed by open_db() in the app lifespan
+mongo_client = MongoClient(
+    settings.mongo_uri,
+    connect=False,
+    maxPoolSize=settings.mongo_max_pool_size,
+    minPoolSize=settings.mongo_min_pool_size,
+    maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+    connectTimeoutMS=settings.mongo_connect_timeout_ms,
+    serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+    socketTimeoutMS=settings.mongo_socket_timeout_ms,
+    waitQueueTimeoutMS=settings.mongo_wait_queue_timeout_ms,
+)
 
 
 # Access database
-medifind_db = mongo_client["medi_find_db"]
+medifind_db = mongo_client[settings.mongo_db_name]
 
 
 # Access a collection to operate on
@@ -21,5 +35,158 @@ user_history_collection = medifind_db["user_history"]
 cart_collection = medifind_db["carts"]
 # orders_collection = medifind_db["orders"]
 prescriptions_collection = medifind_db["prescriptions"]
-saved_pharmacies_collection = medifind_db["saved_pharmacies"]   
+saved_pharmacies_collection = medifind_db["saved_pharmacies"]
 messages_collection = medifind_db["messages"]
+media_collection = medifind_db["media"]
+trending_collection = medifind_db["trending_snapshots"]
+inbox_counters_collection = medifind_db["inbox_counters"]
+cascade_jobs_collection = medifind_db["cascade_jobs"]
+cache_versions_collection = medifind_db["cache_versions"]
+inventory_tombstones_collection = medifind_db["inventory_tombstones"]
+price_stats_collection = medifind_db["price_stats"]
+idempotency_keys_collection = medifind_db["idempotency_keys"]
+migrations_collection = medifind_db["migrations"]
+
+
+def _read_preference(mode, max_staleness):
+    if mode == "primary":
+        return ReadPreference.PRIMARY
+    modes = {
+        "primaryPreferred": PrimaryPreferred,
+        "secondary": Secondary,
+        "secondaryPreferred": SecondaryPreferred,
+        "nearest": Nearest,
+    }
+    return modes[mode](max_staleness=max_staleness)
+
+
+# The public catalog tolerates replication lag, so its routers read
+# through these and spare the primary
+catalog_read_preference = _read_preference(
+    settings.catalog_read_preference, settings.catalog_max_staleness_seconds
+)
+catalog_inventory_collection = med_inventory_collection.with_options(
+    read_preference=catalog_read_preference
+)
+catalog_pharmacies_collection = pharmacies_collection.with_options(
+    read_preference=catalog_read_preference
+)
+catalog_price_stats_collection = price_stats_collection.with_options(
+    read_preference=catalog_read_preference
+)
+
+
+def open_db():
+    # Round trip to the server so the first request does not pay for
+    # server selection and the initial handshake
+    mongo_client.admin.command("ping")
+
+
+def ensure_indexes(database=medifind_db):
+    # Takes the database so tools/query_plans.py can index a scratch copy
+    database["users"].create_index([("email", ASCENDING)])
+    database["pharmacies"].create_index([("user_id", ASCENDING)])
+    database["pharmacies"].create_index([("location", GEOSPHERE)])
+    database["inventory"].create_index(
+        [("pharmacy_id", ASCENDING), ("medicine_name", ASCENDING)]
+    )
+    # A pharmacy's own stock, paged in name order
+    database["inventory"].create_index(
+        [("pharmacy_id", ASCENDING), ("name_key", ASCENDING), ("_id", ASCENDING)]
+    )
+    # Faceted search: filter on name words/category, sort by price (then
+    # _id, so the index yields the exact sort order); price comparisons
+    # read one name's listings in price order
+    database["inventory"].create_index(
+        [("name_tokens", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)]
+    )
+    database["inventory"].create_index(
+        [("category", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)]
+    )
+    database["inventory"].create_index(
+        [("name_key", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)]
+    )
+    # Delta sync reads changes, then deletions, in (time, _id) order; a
+    # backward scan serves newest-first search
+    database["inventory"].create_index([("updated_at", ASCENDING), ("_id", ASCENDING)])
+    database["inventory_tombstones"].create_index(
+        [("deleted_at", ASCENDING), ("_id", ASCENDING)]
+    )
+    database["inventory_tombstones"].create_index(
+        [("deleted_at", ASCENDING)],
+        expireAfterSeconds=settings.sync_tombstone_days * 86400,
+    )
+    database["inventory"].create_index([("pharmacy.location", GEOSPHERE)])
+    # Low-stock items only: a pharmacy's list, and those still to be alerted
+    database["inventory"].create_index(
+        [("pharmacy_id", ASCENDING), ("quantity", ASCENDING)],
+        partialFilterExpression={"low_stock": True},
+    )
+    database["inventory"].create_index(
+        [("updated_at", ASCENDING)],
+        partialFilterExpression={"low_stock": True, "low_stock_notified": False},
+    )
+    # Search history: newest-first per user, expired after the retention period
+    database["user_history"].create_index(
+        [("user_id", ASCENDING), ("searched_at", DESCENDING)]
+    )
+    database["user_history"].create_index(
+        [("searched_at", ASCENDING)],
+        expireAfterSeconds=settings.history_retention_days * 86400,
+    )
+    # Pharmacy inboxes, filtered by read state and ordered by arrival
+    database["messages"].create_index(
+        [("pharmacy_id", ASCENDING), ("is_read", ASCENDING), ("sent_at", ASCENDING)]
+    )
+    database["prescriptions"].create_index(
+        [
+            ("pharmacy_id", ASCENDING),
+            ("is_read", ASCENDING),
+            ("uploaded_at", ASCENDING),
+        ]
+    )
+    # Lookups by owner, also used to clean up after deleted users/pharmacies
+    database["messages"].create_index([("user_id", ASCENDING)])
+    database["prescriptions"].create_index([("user_id", ASCENDING)])
+    database["saved_pharmacies"].create_index(
+        [("user_id", ASCENDING), ("pharmacy_id", ASCENDING)]
+    )
+    database["saved_pharmacies"].create_index([("pharmacy_id", ASCENDING)])
+    database["carts"].create_index([("user_id", ASCENDING)])
+    database["carts"].create_index([("pharmacy_id", ASCENDING)])
+    database["cascade_jobs"].create_index(
+        [("status", ASCENDING), ("lease_until", ASCENDING)]
+    )
+    # Idempotency keys can be retried until they expire
+    database["idempotency_keys"].create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=settings.idempotency_ttl_hours * 3600,
+    )
+    # Trending snapshots only matter for one window
+    database["trending_snapshots"].create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=settings.trending_window_minutes * 60,
+    )
+
+
+# Indexes earlier versions created that the ones above now cover
+REPLACED_INDEXES = {
+    "inventory": [
+        "medicine_name_1",
+        "updated_at_-1",
+        "name_key_1_price_1",
+        "category_1_price_1",
+    ],
+}
+
+
+def drop_replaced_indexes(database=medifind_db):
+    for collection, names in REPLACED_INDEXES.items():
+        existing = database[collection].index_information()
+        for name in names:
+            if name in existing:
+                database[collection].drop_index(name)
+
+
+def close_db():
+    mongo_client.close()
@@ -1,8 +1,8 @@
-import os
 from typing import Annotated
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 import jwt
+from config import settings
 from db import users_collection
 from utils import replace_mongo_id
 from bson.objectid import ObjectId
@@ -14,7 +14,7 @@ def is_authenticated(
     try:
         payload = jwt.decode(
             jwt=authorization.credentials,
-            key=os.getenv("JWT_SECRET_KEY"),
+            key=settings.jwt_secret_key,
             algorithms=["HS256"],
         )
         return payload["id"]
@@ -22,6 +22,25 @@ def is_authenticated(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
 
 
+def optional_user_id(
+    authorization: Annotated[
+        HTTPAuthorizationCredentials | None, Depends(HTTPBearer(auto_error=False))
+    ],
+):
+    # Identify the caller on public endpoints without requiring a token
+    if authorization is None:
+        return None
+    try:
+        payload = jwt.decode(
+            jwt=authorization.credentials,
+            key=settings.jwt_secret_key,
+            algorithms=["HS256"],
+        )
+        return payload["id"]
+    except jwt.InvalidTokenError:
+        return None
+
+
 def authenticated_user(user_id: Annotated[str, Depends(is_authenticated)]):
     user = users_collection.find_one(filter={"_id": ObjectId(user_id)})
     if not user:
@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from routes.users import users_router
 from routes.admin import admin_router
 from routes.meds import inventory_router
@@ -10,21 +11,76 @@ from routes.prescriptions import prescription_router
 from routes.messages import messages_router
 from routes.profiles import profile_router
 from routes.saved_pharms import saved_router
+from routes.inbox import inbox_router
+from routes.sync import sync_router
+from routes.compare import compare_router
 
+from config import settings
+from db import open_db, close_db, ensure_indexes
+from services.passwords import start_hash_pool, shutdown_hash_pool
+from services.name_index import name_index_sync
+from services.cascade import resume_cascade_jobs
+from services.history import history_recorder
+from services.trending import trending_tracker
+from services.price_stats import price_stats
+from services.low_stock import low_stock_alerts
+from services.migrations import run_migrations
+from services.events import event_broker, inbox_fanout
+from services.singleflight import coalescing_stats
+from services.cache import search_cache
+import asyncio
 import cloudinary
-import os
-from dotenv import load_dotenv
+import logging
+import time
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Startup timings, reported by /health
+startup_metrics = {"startup_ms": None, "first_request_ms": None}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Configure Cloudinary
+    cloudinary.config(
+        cloud_name=settings.cloudinary_cloud_name,
+        api_key=settings.cloudinary_api_key,
+        api_secret=settings.cloudinary_api_secret,
+    )
+    # Open and warm the Mongo connection pool
+    open_db()
+    ensure_indexes()
+    # One-off backfills, skipped once recorded as done
+    run_migrations()
+    start_hash_pool()
+    # The autocomplete index is built in the background, then kept in step
+    name_index_sync.start()
+    resume_cascade_jobs()
+    history_recorder.start()
+    trending_tracker.start()
+    price_stats.start()
+    low_stock_alerts.start()
+    # Deliver inbox events on this loop, from this worker or every worker
+    event_broker.bind(asyncio.get_running_loop())
+    if settings.inbox_change_streams:
+        inbox_fanout.start()
+    startup_metrics["startup_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info("Startup completed in %.2f ms", startup_metrics["startup_ms"])
+    yield
+    if settings.inbox_change_streams:
+        inbox_fanout.stop()
+    low_stock_alerts.stop()
+    price_stats.stop()
+    trending_tracker.stop()
+    history_recorder.stop()
+    name_index_sync.stop()
+    shutdown_hash_pool()
+    close_db()
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-)
 
 app = FastAPI(
+    lifespan=lifespan,
     title="RAAAEL MediFind Web App",
     description="A comprehensive advertisement and medicine management app that connects patients and pharmacies",
     version="1.0.0",
@@ -37,11 +93,39 @@ app = FastAPI(
 )
 
 
+@app.middleware("http")
+async def time_first_request(request: Request, call_next):
+    if startup_metrics["first_request_ms"] is not None:
+        return await call_next(request)
+    started = time.perf_counter()
+    response = await call_next(request)
+    if startup_metrics["first_request_ms"] is None:
+        startup_metrics["first_request_ms"] = round(
+            (time.perf_counter() - started) * 1000, 2
+        )
+        logger.info(
+            "First request %s served in %.2f ms",
+            request.url.path,
+            startup_metrics["first_request_ms"],
+        )
+    return response
+
+
 @app.get("/")
 def read_root():
     return {"Message": "Welcome to the RAAEL MediFind App"}
 
 
+@app.get("/health")
+def health_check():
+    return {
+        "status": "ok",
+        "startup": startup_metrics,
+        "coalescing": coalescing_stats(),
+        "search_cache": search_cache.stats(),
+    }
+
+
 # Plugging routers into main.py
 app.include_router(users_router)
 app.include_router(admin_router)
@@ -55,5 +139,8 @@ app.include_router(count_router)
 app.include_router(prescription_router)
 app.include_router(saved_router)
 app.include_router(messages_router)
+app.include_router(inbox_router)
+app.include_router(sync_router)
+app.include_router(compare_router)
 
 
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from bson import ObjectId
 from db import users_collection, pharmacies_collection
 from typing import Annotated
 from utils import replace_mongo_id
 from dependencies.authz import has_roles
+from services.cascade import (
+    create_cascade_job,
+    format_cascade_job,
+    get_cascade_job,
+    run_cascade_job,
+)
 
 
 # Creating an Admin Router
@@ -29,24 +35,65 @@ def get_all_pharmacies(user: Annotated[dict, Depends(has_roles(["admin"]))]):
     return {"Pharmacies": formatted_pharmacies}
 
 
+# Deleting a user or pharmacy removes the document right away; the data
+# hanging off it is hidden, then cleaned up, by a background cascade job.
 @admin_router.delete("/users/{user_id}/delete")
-def delete_user(user_id: str, user: dict = Depends(has_roles(["admin"]))):
+def delete_user(
+    user_id: str,
+    background_tasks: BackgroundTasks,
+    user: dict = Depends(has_roles(["admin"])),
+):
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid ID format")
     result = users_collection.delete_one({"_id": ObjectId(user_id)})
     if result.deleted_count == 0:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
-    return {"message": "User deleted successfully."}
+    job_id = create_cascade_job("user", ObjectId(user_id))
+    background_tasks.add_task(run_cascade_job, job_id)
+    return {"message": "User deleted successfully.", "job_id": str(job_id)}
 
 
 @admin_router.delete("/pharmacies/{pharmacy_id}/delete")
-def delete_pharmacy(pharmacy_id: str, user: dict = Depends(has_roles(["admin"]))):
+def delete_pharmacy(
+    pharmacy_id: str,
+    background_tasks: BackgroundTasks,
+    user: dict = Depends(has_roles(["admin"])),
+):
     if not ObjectId.is_valid(pharmacy_id):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid ID format")
     result = pharmacies_collection.delete_one({"_id": ObjectId(pharmacy_id)})
     if result.deleted_count == 0:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Pharmacy not found")
-    return {"message": "Pharmacy deleted successfully."}
+    job_id = create_cascade_job("pharmacy", ObjectId(pharmacy_id))
+    background_tasks.add_task(run_cascade_job, job_id)
+    return {"message": "Pharmacy deleted successfully.", "job_id": str(job_id)}
+
+
+@admin_router.get("/admin/jobs/{job_id}")
+def get_cascade_job_status(job_id: str, user: dict = Depends(has_roles(["admin"]))):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid ID format")
+    job = get_cascade_job(job_id)
+    if not job:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Job not found")
+    return format_cascade_job(job)
+
+
+@admin_router.post("/admin/jobs/{job_id}/retry")
+def retry_cascade_job(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    user: dict = Depends(has_roles(["admin"])),
+):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid ID format")
+    job = get_cascade_job(job_id)
+    if not job:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Job not found")
+    if job["status"] != "failed":
+        raise HTTPException(status.HTTP_409_CONFLICT, "Only failed jobs can be retried")
+    background_tasks.add_task(run_cascade_job, job["_id"])
+    return {"message": "Job retry started.", "job_id": job_id}
 
 
 # Mini statistics of users on the platform, limited for admin use only.
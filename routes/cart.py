@@ -4,8 +4,9 @@ from bson import ObjectId
 from datetime import datetime
 from db import cart_collection, med_inventory_collection
 from dependencies.authn import is_authenticated
+from services.idempotency import IdempotentRoute
 
-cart_router = APIRouter(tags=["Cart"], prefix="/cart")
+cart_router = APIRouter(tags=["Cart"], prefix="/cart", route_class=IdempotentRoute)
 
 
 @cart_router.post("/add")
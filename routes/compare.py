@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, status
+from db import catalog_price_stats_collection
+from services.name_index import medicine_names
+from utils import normalize_name
+
+compare_router = APIRouter(tags=["Search"], prefix="/medicines")
+
+
+def format_offer(offer):
+    pharmacy = offer["pharmacy"]
+    return {
+        "medicine_id": str(offer["medicine_id"]),
+        "pharmacy_id": str(offer["pharmacy_id"]),
+        "price": offer["price"],
+        "quantity": offer["quantity"],
+        "pharmacy": {
+            "pharmacy_name": pharmacy.get("pharmacy_name"),
+            "digital_address": pharmacy.get("digital_address"),
+            "gps_location": pharmacy.get("gps_location"),
+        },
+    }
+
+
+@compare_router.get("/compare")
+def compare_prices(name: str):
+    """Price spread and cheapest offers for one medicine across pharmacies"""
+    name_key = normalize_name(name)
+    if not name_key:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Provide a medicine name.")
+    # Precomputed by services.price_stats; refreshed shortly after stock changes
+    stats = catalog_price_stats_collection.find_one({"_id": name_key})
+    if not stats:
+        close_matches = medicine_names.fuzzy(name)
+        detail = f"No pharmacy has '{name}' in stock."
+        if close_matches:
+            detail += f" Did you mean '{close_matches[0]['name']}'?"
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail)
+    return {
+        "name": stats["name"],
+        "min_price": stats["min_price"],
+        "median_price": stats["median_price"],
+        "max_price": stats["max_price"],
+        "listings": stats["listings"],
+        "pharmacies_in_stock": stats["pharmacies_in_stock"],
+        "cheapest_offers": [format_offer(offer) for offer in stats["offers"]],
+        "refreshed_at": stats["refreshed_at"],
+    }
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, status
-from db import med_inventory_collection, pharmacies_collection
+from db import catalog_inventory_collection, catalog_pharmacies_collection
 from bson import ObjectId
 
 count_router = APIRouter(tags=["Counts"])
@@ -8,7 +8,7 @@ count_router = APIRouter(tags=["Counts"])
 # Get total count of all medicines
 @count_router.get("/meds/all/count")
 def get_meds_count():
-    meds_count = med_inventory_collection.count_documents(filter={})
+    meds_count = catalog_inventory_collection.count_documents(filter={})
     return {"data": meds_count}
 
 
@@ -22,12 +22,12 @@ def get_meds_count_by_pharmacy(pharmacy_id: str):
         )
 
     # Check if the pharmacy exists
-    pharmacy = pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
+    pharmacy = catalog_pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
     if not pharmacy:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Pharmacy not found")
 
     # Count medicines linked to this pharmacy
-    meds_count = med_inventory_collection.count_documents(
+    meds_count = catalog_inventory_collection.count_documents(
         {"pharmacy_id": ObjectId(pharmacy_id)}
     )
 
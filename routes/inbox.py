@@ -0,0 +1,69 @@
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Annotated
+from bson import ObjectId
+from config import settings
+from db import pharmacies_collection
+from dependencies.authn import is_authenticated
+from dependencies.authz import has_roles
+from services.events import event_broker
+from services.inbox import get_unread_counts
+
+inbox_router = APIRouter(tags=["Inbox"], prefix="/inbox")
+
+
+# Unread badges for the pharmacy dashboard
+@inbox_router.get("/unread-counts")
+def get_inbox_unread_counts(
+    user_id: Annotated[str, Depends(is_authenticated)],
+    _: Annotated[None, Depends(has_roles(["pharmacy"]))],
+):
+    """Unread messages and prescriptions, read from per-pharmacy counters."""
+    pharmacy = pharmacies_collection.find_one(
+        {"user_id": ObjectId(user_id)}, {"_id": 1}
+    )
+    if not pharmacy:
+        raise HTTPException(status_code=404, detail="Pharmacy not found")
+
+    return {"unread": get_unread_counts(pharmacy["_id"])}
+
+
+# Server-sent events for new messages and prescriptions
+@inbox_router.get("/stream")
+async def stream_inbox_events(
+    request: Request,
+    user_id: Annotated[str, Depends(is_authenticated)],
+    _: Annotated[None, Depends(has_roles(["pharmacy"]))],
+):
+    """Push new-item events so dashboards fetch deltas instead of polling."""
+    pharmacy = await run_in_threadpool(
+        pharmacies_collection.find_one, {"user_id": ObjectId(user_id)}, {"_id": 1}
+    )
+    if not pharmacy:
+        raise HTTPException(status_code=404, detail="Pharmacy not found")
+    channel = str(pharmacy["_id"])
+
+    async def event_stream():
+        queue = event_broker.subscribe(channel)
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=settings.sse_heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            event_broker.unsubscribe(channel, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,16 +1,63 @@
-from fastapi import HTTPException, status, APIRouter, Depends, File, UploadFile, Form
+import re
+from fastapi import (
+    HTTPException,
+    status,
+    APIRouter,
+    Depends,
+    File,
+    UploadFile,
+    Form,
+    Header,
+    Query,
+    Response,
+)
 from db import med_inventory_collection, pharmacies_collection
 from bson.objectid import ObjectId
-from utils import replace_mongo_id
+from utils import (
+    format_inventory_item,
+    pharmacy_summary,
+    normalize_name,
+    name_tokens,
+    decode_cursor,
+    encode_cursor,
+)
 from typing import Annotated, Optional
-import cloudinary
-import cloudinary.uploader
 from dependencies.authn import is_authenticated
 from dependencies.authz import has_roles
 from datetime import datetime, timezone
+from services.name_index import medicine_names
+from services.media import upload_image
+from services.cache import inventory_versions
+from services.consistency import read_your_writes, writer_session
+from services.sync import record_deletions
+from services.idempotency import IdempotentRoute
+from services.price_stats import price_stats
+from services.low_stock import (
+    apply_low_stock_threshold,
+    low_stock_fields,
+    low_stock_threshold,
+)
 
 # Create inventory router
-inventory_router = APIRouter(tags=["Pharmacies"], prefix="/inventory")
+inventory_router = APIRouter(
+    tags=["Pharmacies"], prefix="/inventory", route_class=IdempotentRoute
+)
+
+
+def build_stock_filter(pharmacy_id, query="", after=None):
+    stock_filter = {"pharmacy_id": pharmacy_id}
+    name_range = {}
+    if query:
+        # Anchored on the normalized name so it becomes an index range
+        name_range["$regex"] = "^" + re.escape(normalize_name(query))
+    if after:
+        name_key, last_id = after
+        name_range["$gte"] = name_key
+        # Skip what the previous page already returned for that same name
+        stock_filter["$nor"] = [{"name_key": name_key, "_id": {"$lte": last_id}}]
+    if name_range:
+        stock_filter["name_key"] = name_range
+    return stock_filter
 
 
 # Inventory endpoints (pharmacy-only)
@@ -19,32 +66,108 @@ def get_my_stock(
     user_id: Annotated[str, Depends(is_authenticated)],
     _=Depends(has_roles(["pharmacy"])),
     query: str = "",
-    limit: int = 10,
-    skip: int = 0,
+    limit: Annotated[int, Query(ge=1, le=100)] = 10,
+    cursor: str | None = None,
+    include_total: bool = False,
+    x_consistency_token: Annotated[str | None, Header()] = None,
 ):
+    """List the pharmacy's stock by name, a page at a time.
+
+    Pass the returned next_cursor to get the following page; it is null
+    on the last page. Send the X-Consistency-Token of a previous write to
+    be sure to see it.
+    """
     # Get pharmacy_id from user
     pharmacy_doc = pharmacies_collection.find_one({"user_id": ObjectId(user_id)})
     if not pharmacy_doc:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Pharmacy not found!")
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor")
 
-    # Get stock from database
-    stock = med_inventory_collection.find(
-        filter={
-            "pharmacy_id": ObjectId(pharmacy_doc["_id"]),
-            "$or": [
-                {"medicine_name": {"$regex": query, "$options": "i"}},
-            ],
-        },
-        limit=int(limit),
-        skip=int(skip),
-    ).to_list()
+    # Get stock from database, one extra item to know if more follow
+    def read(collection, session):
+        stock = list(
+            collection.find(
+                build_stock_filter(pharmacy_doc["_id"], query, after),
+                session=session,
+            )
+            .sort([("name_key", 1), ("_id", 1)])
+            .limit(limit + 1)
+        )
+        total = None
+        if include_total:
+            total = collection.count_documents(
+                build_stock_filter(pharmacy_doc["_id"], query), session=session
+            )
+        return stock, total
+
+    stock, total = read_your_writes(user_id, x_consistency_token, read)
+    next_cursor = None
+    if len(stock) > limit:
+        stock = stock[:limit]
+        next_cursor = encode_cursor(stock[-1]["name_key"], stock[-1]["_id"])
     # Return response
-    formatted_stock = []
-    for doc in stock:
-        item = replace_mongo_id(doc)
-        item["pharmacy_id"] = str(item["pharmacy_id"])
-        formatted_stock.append(item)
-    return {"data": formatted_stock}
+    formatted_stock = [format_inventory_item(doc) for doc in stock]
+    response = {"data": formatted_stock, "next_cursor": next_cursor}
+    if include_total:
+        response["total"] = total
+    return response
+
+
+@inventory_router.get("/low-stock")
+def get_low_stock(
+    user_id: Annotated[str, Depends(is_authenticated)],
+    _=Depends(has_roles(["pharmacy"])),
+    limit: Annotated[int, Query(ge=1, le=500)] = 100,
+):
+    """List the pharmacy's items at or below its threshold, lowest first."""
+    pharmacy_doc = pharmacies_collection.find_one({"user_id": ObjectId(user_id)})
+    if not pharmacy_doc:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Pharmacy not found!")
+    # Served from the partial index over low-stock items only
+    items = (
+        med_inventory_collection.find(
+            {"pharmacy_id": pharmacy_doc["_id"], "low_stock": True},
+            {"medicine_name": 1, "quantity": 1, "price": 1, "category": 1},
+        )
+        .sort([("pharmacy_id", 1), ("quantity", 1)])
+        .limit(limit)
+    )
+    return {
+        "threshold": low_stock_threshold(pharmacy_doc),
+        "data": [
+            {
+                "id": str(item["_id"]),
+                "medicine_name": item["medicine_name"],
+                "quantity": item["quantity"],
+                "price": item.get("price"),
+                "category": item.get("category"),
+            }
+            for item in items
+        ],
+    }
+
+
+@inventory_router.put("/low-stock/threshold")
+def set_low_stock_threshold(
+    threshold: Annotated[int, Form(ge=0)],
+    user_id: Annotated[str, Depends(is_authenticated)],
+    _=Depends(has_roles(["pharmacy"])),
+):
+    """Set the quantity at or below which the pharmacy's items count as low."""
+    pharmacy_doc = pharmacies_collection.find_one_and_update(
+        {"user_id": ObjectId(user_id)},
+        {"$set": {"low_stock_threshold": threshold}},
+        projection={"_id": 1},
+    )
+    if not pharmacy_doc:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Pharmacy not found!")
+    apply_low_stock_threshold(pharmacy_doc["_id"], threshold)
+    return {"message": "Low-stock threshold updated", "threshold": threshold}
 
 
 @inventory_router.post("/add")
@@ -55,6 +178,7 @@ def add_medicine(
     description: Annotated[str, Form()],
     category: Annotated[str, Form()],
     user_id: Annotated[str, Depends(is_authenticated)],
+    response: Response,
     _=Depends(has_roles(["pharmacy"])),
     flyer: Annotated[Optional[UploadFile], File()] = None,
 ):
@@ -81,23 +205,31 @@ def add_medicine(
     # Upload medicine_image to cloudinary if provided
     image_url = None
     if flyer:
-        upload_result = cloudinary.uploader.upload(flyer.file)
-        image_url = upload_result["secure_url"]
-        print(upload_result)
+        image_url = upload_image(flyer)
 
     # Insert medicine into database
-    med_inventory_collection.insert_one(
-        {
-            "pharmacy_id": ObjectId(pharmacy_doc["_id"]),
-            "medicine_name": medicine_name,
-            "quantity": quantity,
-            "price": price,
-            "description": description,
-            "category": category,
-            "flyer": image_url,
-            "updated_at": datetime.now(tz=timezone.utc),
-        }
-    )
+    with writer_session(user_id, response) as session:
+        med_inventory_collection.insert_one(
+            {
+                "pharmacy_id": ObjectId(pharmacy_doc["_id"]),
+                "medicine_name": medicine_name,
+                "name_key": normalize_name(medicine_name),
+                "name_tokens": name_tokens(medicine_name),
+                "quantity": quantity,
+                "price": price,
+                "description": description,
+                "category": category,
+                "flyer": image_url,
+                "pharmacy": pharmacy_summary(pharmacy_doc),
+                "updated_at": datetime.now(tz=timezone.utc),
+                "low_stock_notified": False,
+                **low_stock_fields(quantity, low_stock_threshold(pharmacy_doc)),
+            },
+            session=session,
+        )
+    medicine_names.add(medicine_name, quantity)
+    inventory_versions.bump()
+    price_stats.mark_dirty(medicine_name)
     # Return response
     return {"message": "Medicine added to stock successfully"}
 
@@ -124,9 +256,7 @@ def get_medicine_by_id(
     if not medicine:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Medicine not found!")
     # Return response
-    formatted = replace_mongo_id(medicine)
-    formatted["pharmacy_id"] = str(formatted["pharmacy_id"])
-    return {"data": formatted}
+    return {"data": format_inventory_item(medicine)}
 
 
 @inventory_router.put("/my-stock/{medicine_id}")
@@ -138,6 +268,7 @@ def update_medicine(
     description: Annotated[str, Form()],
     category: Annotated[str, Form()],
     user_id: Annotated[str, Depends(is_authenticated)],
+    response: Response,
     _=Depends(has_roles(["pharmacy"])),
     flyer: Annotated[Optional[UploadFile], File()] = None,
 ):
@@ -151,29 +282,45 @@ def update_medicine(
     if not pharmacy_doc:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Pharmacy not found!")
 
-    # Upload medicine_image to cloudinary if provided
-    image_url = None
+    updates = {
+        "medicine_name": medicine_name,
+        "name_key": normalize_name(medicine_name),
+        "name_tokens": name_tokens(medicine_name),
+        "quantity": quantity,
+        "price": price,
+        "description": description,
+        "category": category,
+        "pharmacy": pharmacy_summary(pharmacy_doc),
+        **low_stock_fields(quantity, low_stock_threshold(pharmacy_doc)),
+    }
+    # Upload medicine_image to cloudinary if provided, otherwise keep the
+    # existing flyer
     if flyer:
-        upload_result = cloudinary.uploader.upload(flyer.file)
-        image_url = upload_result["secure_url"]
-        print(upload_result)
-    # Replace medicine in database
-    med_inventory_collection.replace_one(
-        filter={
-            "_id": ObjectId(medicine_id),
-            "pharmacy_id": ObjectId(pharmacy_doc["_id"]),
-        },
-        replacement={
-            "pharmacy_id": ObjectId(pharmacy_doc["_id"]),
-            "medicine_name": medicine_name,
-            "quantity": quantity,
-            "price": price,
-            "description": description,
-            "category": category,
-            "flyer": image_url,
-            "updated_at": datetime.now(tz=timezone.utc),
-        },
-    )
+        updates["flyer"] = upload_image(flyer)
+    # Stamped after the upload, which can outlast the sync settle time
+    updates["updated_at"] = datetime.now(tz=timezone.utc)
+    # Update medicine in database
+    with writer_session(user_id, response) as session:
+        previous = med_inventory_collection.find_one_and_update(
+            filter={
+                "_id": ObjectId(medicine_id),
+                "pharmacy_id": ObjectId(pharmacy_doc["_id"]),
+            },
+            update={"$set": updates},
+            session=session,
+        )
+        if previous and previous.get("name_key") != updates["name_key"]:
+            # Lets other workers' name indexes recount the name it left
+            med_inventory_collection.update_one(
+                {"_id": previous["_id"]},
+                {"$set": {"renamed_from": previous.get("name_key")}},
+                session=session,
+            )
+    if previous:
+        medicine_names.remove(previous["medicine_name"], previous.get("quantity"))
+        medicine_names.add(medicine_name, quantity)
+        inventory_versions.bump()
+        price_stats.mark_dirty(previous["medicine_name"], medicine_name)
     return {"message": "Medicine updated successfully"}
 
 
@@ -181,7 +328,9 @@ def update_medicine(
     "/my-stock/{medicine_id}", dependencies=[Depends(has_roles(["pharmacy"]))]
 )
 def delete_medicine(
-    medicine_id: str, user_id: Annotated[str, Depends(is_authenticated)]
+    medicine_id: str,
+    user_id: Annotated[str, Depends(is_authenticated)],
+    response: Response,
 ):
     # Check if medicine_id is valid mongo id
     if not ObjectId.is_valid(medicine_id):
@@ -192,13 +341,28 @@ def delete_medicine(
     pharmacy_doc = pharmacies_collection.find_one({"user_id": ObjectId(user_id)})
     if not pharmacy_doc:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Pharmacy not found!")
-    # Delete medicine from database
-    delete_result = med_inventory_collection.delete_one(
-        filter={
-            "_id": ObjectId(medicine_id),
-            "pharmacy_id": ObjectId(pharmacy_doc["_id"]),
-        }
+    medicine_filter = {
+        "_id": ObjectId(medicine_id),
+        "pharmacy_id": ObjectId(pharmacy_doc["_id"]),
+    }
+    medicine = med_inventory_collection.find_one(
+        medicine_filter, {"medicine_name": 1, "quantity": 1, "pharmacy_id": 1}
     )
-    if not delete_result.deleted_count:
+    if not medicine:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Medicine not found to delete!")
+    # Tombstone first, so synced clients learn of the delete even if we
+    # stop right after it
+    record_deletions([medicine])
+    # Delete medicine from database
+    with writer_session(user_id, response) as session:
+        deleted = med_inventory_collection.find_one_and_delete(
+            filter=medicine_filter,
+            projection={"medicine_name": 1, "quantity": 1},
+            session=session,
+        )
+    if not deleted:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Medicine not found to delete!")
+    medicine_names.remove(deleted["medicine_name"], deleted.get("quantity"))
+    inventory_versions.bump()
+    price_stats.mark_dirty(deleted["medicine_name"])
     return {"message": "Medicine deleted successfully"}
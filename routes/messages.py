@@ -5,8 +5,14 @@ from datetime import datetime, timezone
 from db import messages_collection, pharmacies_collection, users_collection
 from dependencies.authn import is_authenticated
 from dependencies.authz import has_roles
+from services.events import publish_inbox_event
+from services.inbox import BulkReadRequest, bump_unread, mark_read_in_bulk
+from services.idempotency import IdempotentRoute
+from services.low_stock import SYSTEM_SENDER
 
-messages_router = APIRouter(tags=["Messaging"], prefix="/messages")
+messages_router = APIRouter(
+    tags=["Messaging"], prefix="/messages", route_class=IdempotentRoute
+)
 
 
 # 1. Send Message (User → Pharmacy)
@@ -22,16 +28,17 @@ def send_message(
     if not pharmacy:
         raise HTTPException(status_code=404, detail="Pharmacy not found")
 
-    messages_collection.insert_one(
-        {
-            "user_id": ObjectId(user_id),
-            "pharmacy_id": ObjectId(pharmacy_id),
-            "subject": subject,
-            "message": message,
-            "sent_at": datetime.now(tz=timezone.utc),
-            "is_read": False,
-        }
-    )
+    message_doc = {
+        "user_id": ObjectId(user_id),
+        "pharmacy_id": ObjectId(pharmacy_id),
+        "subject": subject,
+        "message": message,
+        "sent_at": datetime.now(tz=timezone.utc),
+        "is_read": False,
+    }
+    messages_collection.insert_one(message_doc)
+    bump_unread(pharmacy["_id"], "messages", 1)
+    publish_inbox_event("message", message_doc)
 
     return {"message": "Message sent successfully"}
 
@@ -41,27 +48,37 @@ def send_message(
 def get_pharmacy_messages(
     user_id: Annotated[str, Depends(is_authenticated)],
     _: Annotated[None, Depends(has_roles(["pharmacy"]))],
+    since: datetime | None = None,
 ):
-    """Get all messages sent to the pharmacy."""
+    """Get messages sent to the pharmacy, or only those newer than `since`."""
     # Find the pharmacy linked to the authenticated user
     pharmacy = pharmacies_collection.find_one({"user_id": ObjectId(user_id)})
     if not pharmacy:
         raise HTTPException(status_code=404, detail="Pharmacy not found")
 
     # Fetch messages sent to that pharmacy
-    messages = list(messages_collection.find({"pharmacy_id": pharmacy["_id"]}))
-    if not messages:
+    inbox_filter = {"pharmacy_id": pharmacy["_id"]}
+    if since:
+        inbox_filter["sent_at"] = {"$gt": since}
+    messages = list(messages_collection.find(inbox_filter).sort("sent_at", 1))
+    if not messages and not since:
         raise HTTPException(status_code=404, detail="No messages found")
 
     result = []
     for msg in messages:
-        user = users_collection.find_one({"_id": ObjectId(msg["user_id"])})
+        # Alerts such as low stock come from the app, not a user
+        if msg.get("sender") == "system":
+            sender_name = SYSTEM_SENDER
+        else:
+            user = users_collection.find_one({"_id": ObjectId(msg["user_id"])})
+            sender_name = user.get("username") if user else "Unknown"
         result.append(
             {
                 "message_id": str(msg["_id"]),
+                "kind": msg.get("kind", "message"),
                 "subject": msg["subject"],
                 "message": msg["message"],
-                "sender_name": user.get("username") if user else "Unknown",
+                "sender_name": sender_name,
                 "sent_at": msg["sent_at"].isoformat(),
                 "is_read": msg.get("is_read", False),
             }
@@ -91,10 +108,27 @@ def mark_message_as_read(
 
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Message not found or already read")
+    bump_unread(pharmacy["_id"], "messages", -1)
 
     return {"message": "Message marked as read"}
 
 
+# 3b. Mark many messages as read
+@messages_router.patch("/read")
+def mark_messages_as_read(
+    request: BulkReadRequest,
+    user_id: Annotated[str, Depends(is_authenticated)],
+    _: Annotated[None, Depends(has_roles(["pharmacy"]))],
+):
+    """Mark messages read by id and/or everything sent up to a timestamp."""
+    pharmacy = pharmacies_collection.find_one({"user_id": ObjectId(user_id)})
+    if not pharmacy:
+        raise HTTPException(status_code=404, detail="Pharmacy not found")
+
+    updated = mark_read_in_bulk(pharmacy["_id"], "messages", request)
+    return {"updated_count": updated, "message": "Messages marked as read"}
+
+
 # 4. User “Sent Messages” (view messages they’ve sent)
 @messages_router.get("/sent")
 def get_user_sent_messages(
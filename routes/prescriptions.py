@@ -1,55 +1,121 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from typing import Annotated, Optional
 from datetime import datetime, timezone
 from bson import ObjectId
 import cloudinary.uploader
+from config import settings
 from db import prescriptions_collection, pharmacies_collection
 from dependencies.authn import is_authenticated
 from dependencies.authz import has_roles
+from services.events import publish_inbox_event
+from services.inbox import BulkReadRequest, bump_unread, mark_read_in_bulk
+from services.idempotency import IdempotentRoute
+from services.uploads import read_streamed_upload
+
+prescription_router = APIRouter(
+    tags=["Prescription"], prefix="/prescriptions", route_class=IdempotentRoute
+)
+
+
+PRESCRIPTION_TYPES = ["image/jpeg", "image/png", "application/pdf"]
+
+# The body is parsed by hand, so describe it for the OpenAPI docs
+PRESCRIPTION_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["pharmacy_id", "title", "file"],
+                    "properties": {
+                        "pharmacy_id": {"type": "string"},
+                        "title": {"type": "string"},
+                        "notes": {"type": "string"},
+                        "file": {"type": "string", "format": "binary"},
+                    },
+                }
+            }
+        },
+    }
+}
 
-prescription_router = APIRouter(tags=["Prescription"], prefix="/prescriptions")
+
+def find_pharmacy(pharmacy_id):
+    if not pharmacy_id or not ObjectId.is_valid(pharmacy_id):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid pharmacy ID format")
+    pharmacy = pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
+    if not pharmacy:
+        raise HTTPException(status_code=404, detail="Pharmacy not found")
+    return pharmacy
 
 
 # 1️ Upload and send prescription (User → Pharmacy)
-@prescription_router.post("/send")
-def send_prescription_to_pharmacy(
+@prescription_router.post("/send", openapi_extra=PRESCRIPTION_FORM_SCHEMA)
+async def send_prescription_to_pharmacy(
+    request: Request,
     user_id: Annotated[str, Depends(is_authenticated)],
-    pharmacy_id: Annotated[str, Form(...)],
-    title: Annotated[str, Form(...)],
-    file: Annotated[UploadFile, File(...)],
-    notes: Annotated[Optional[str], Form()] = None,
+    pharmacy_id: Annotated[Optional[str], Query()] = None,
 ):
     """
     Upload and send a prescription (image or PDF) to a selected pharmacy.
+
+    The file is streamed to a spooled temp file and checked as it arrives.
+    Passing pharmacy_id as a query parameter validates it before any of
+    the body is read; otherwise send the pharmacy_id field before the file.
     """
-    # Validate file type
-    allowed_types = ["image/jpeg", "image/png", "application/pdf"]
-    if file.content_type not in allowed_types:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid file type. Only JPG, PNG, or PDF are allowed.",
+    pharmacy = None
+    if pharmacy_id:
+        pharmacy = await run_in_threadpool(find_pharmacy, pharmacy_id)
+
+    async def check_pharmacy(fields):
+        nonlocal pharmacy
+        if pharmacy is None and "pharmacy_id" in fields:
+            pharmacy = await run_in_threadpool(find_pharmacy, fields["pharmacy_id"])
+
+    upload = await read_streamed_upload(
+        request,
+        "file",
+        settings.max_prescription_bytes,
+        PRESCRIPTION_TYPES,
+        before_file=check_pharmacy,
+    )
+    with upload.file:
+        # Check if pharmacy exists when its field came after the file
+        if pharmacy is None:
+            pharmacy = await run_in_threadpool(
+                find_pharmacy, upload.fields.get("pharmacy_id")
+            )
+        title = upload.fields.get("title")
+        if not title:
+            raise HTTPException(
+                status.HTTP_422_UNPROCESSABLE_ENTITY, "Title is required"
+            )
+
+        # Upload to Cloudinary in chunks straight from the spooled file
+        upload_result = await run_in_threadpool(
+            cloudinary.uploader.upload_large,
+            upload.file,
+            resource_type="auto",
+            chunk_size=settings.upload_chunk_bytes,
+            filename=upload.filename or "prescription",
         )
-
-    # Check if pharmacy exists
-    pharmacy = pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
-    if not pharmacy:
-        raise HTTPException(status_code=404, detail="Pharmacy not found")
-
-    # Upload to Cloudinary
-    upload_result = cloudinary.uploader.upload(file.file)
     file_url = upload_result["secure_url"]
 
     # Save in MongoDB
     prescription_doc = {
         "user_id": ObjectId(user_id),
-        "pharmacy_id": ObjectId(pharmacy_id),
+        "pharmacy_id": pharmacy["_id"],
         "title": title,
-        "notes": notes,
+        "notes": upload.fields.get("notes"),
         "file_url": file_url,
         "uploaded_at": datetime.now(tz=timezone.utc),
         "is_read": False,
     }
-    prescriptions_collection.insert_one(prescription_doc)
+    await run_in_threadpool(prescriptions_collection.insert_one, prescription_doc)
+    await run_in_threadpool(bump_unread, pharmacy["_id"], "prescriptions", 1)
+    publish_inbox_event("prescription", prescription_doc)
 
     return {
         "message": "Prescription sent successfully to pharmacy",
@@ -87,16 +153,23 @@ def get_user_prescriptions(user_id: Annotated[str, Depends(is_authenticated)]):
 def get_pharmacy_prescriptions(
     user_id: Annotated[str, Depends(is_authenticated)],
     _: Annotated[None, Depends(has_roles(["pharmacy"]))],
+    since: Optional[datetime] = None,
 ):
     """
-    Pharmacy can view prescriptions sent to them by users.
+    Pharmacy can view prescriptions sent to them by users, or only those
+    newer than `since`.
     """
     pharmacy = pharmacies_collection.find_one({"user_id": ObjectId(user_id)})
     if not pharmacy:
         raise HTTPException(status_code=404, detail="Pharmacy not found")
 
-    prescriptions = list(prescriptions_collection.find({"pharmacy_id": pharmacy["_id"]}))
-    if not prescriptions:
+    inbox_filter = {"pharmacy_id": pharmacy["_id"]}
+    if since:
+        inbox_filter["uploaded_at"] = {"$gt": since}
+    prescriptions = list(
+        prescriptions_collection.find(inbox_filter).sort("uploaded_at", 1)
+    )
+    if not prescriptions and not since:
         raise HTTPException(status_code=404, detail="No prescriptions found")
 
     result = []
@@ -134,5 +207,24 @@ def mark_prescription_as_read(
 
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Prescription not found or already marked read")
+    bump_unread(pharmacy["_id"], "prescriptions", -1)
 
     return {"message": "Prescription marked as read"}
+
+
+# 5 Pharmacy marks many prescriptions as read
+@prescription_router.patch("/read")
+def mark_prescriptions_as_read(
+    request: BulkReadRequest,
+    user_id: Annotated[str, Depends(is_authenticated)],
+    _: Annotated[None, Depends(has_roles(["pharmacy"]))],
+):
+    """
+    Mark prescriptions read by id and/or everything uploaded up to a timestamp.
+    """
+    pharmacy = pharmacies_collection.find_one({"user_id": ObjectId(user_id)})
+    if not pharmacy:
+        raise HTTPException(status_code=404, detail="Pharmacy not found")
+
+    updated = mark_read_in_bulk(pharmacy["_id"], "prescriptions", request)
+    return {"updated_count": updated, "message": "Prescriptions marked as read"}
@@ -1,10 +1,15 @@
 # I need to create an endpoint to get user profile information and user history (previously viewed items, orders, etc.) in routes/profiles.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from db import users_collection, user_history_collection
+from datetime import datetime
+from fastapi import APIRouter, Depends, Form, HTTPException, Query, status
+from pymongo import ReturnDocument
+from db import users_collection, user_history_collection, pharmacies_collection
 from bson.objectid import ObjectId
-from utils import replace_mongo_id
+from utils import geo_point, replace_mongo_id
 from typing import Annotated
 from dependencies.authn import is_authenticated
+from dependencies.authz import has_roles
+from services.history import history_recorder
+from services.projections import sync_pharmacy_summary
 
 profile_router = APIRouter(tags=["Profile"], prefix="/profile")
 
@@ -21,14 +26,55 @@ def get_user_profile(user_id: Annotated[str, Depends(is_authenticated)]):
     user_info.pop("password", None)
     return {"data": user_info, "message": "Profile fetched successfully"}
 
-"""
+
+# pharmacy profile update endpoint
+@profile_router.patch("/me/pharmacy")
+def update_pharmacy_profile(
+    user_id: Annotated[str, Depends(is_authenticated)],
+    _: Annotated[None, Depends(has_roles(["pharmacy"]))],
+    pharmacy_name: Annotated[str | None, Form()] = None,
+    digital_address: Annotated[str | None, Form()] = None,
+    latitude: Annotated[float | None, Form()] = None,
+    longitude: Annotated[float | None, Form()] = None,
+):
+    updates = {}
+    if pharmacy_name:
+        updates["pharmacy_name"] = pharmacy_name
+    if digital_address:
+        updates["digital_address"] = digital_address
+    if latitude is not None and longitude is not None:
+        updates["gps_location"] = {"lat": latitude, "lon": longitude}
+        updates["location"] = geo_point(updates["gps_location"])
+    if not updates:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Nothing to update!")
+
+    pharmacy = pharmacies_collection.find_one_and_update(
+        {"user_id": ObjectId(user_id)},
+        {"$set": updates},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not pharmacy:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Pharmacy not found!")
+    # Refresh the pharmacy summary embedded in its inventory
+    sync_pharmacy_summary(pharmacy)
+    return {"message": "Pharmacy profile updated successfully"}
+
+
 # search history endpoint
 @profile_router.get("/me/history")
-def get_user_history(user_id: Annotated[str, Depends(is_authenticated)]):
+def get_user_history(
+    user_id: Annotated[str, Depends(is_authenticated)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    before: datetime | None = None,
+):
+    # Page backwards from "before" so each page is one indexed range scan
+    history_filter = {"user_id": ObjectId(user_id)}
+    if before:
+        history_filter["searched_at"] = {"$lt": before}
     history = list(
-        user_history_collection.find({"user_id": ObjectId(user_id)}).sort(
-            "searched_at", -1
-        )
+        user_history_collection.find(history_filter)
+        .sort("searched_at", -1)
+        .limit(limit)
     )
     formatted_history = []
     for h in history:
@@ -42,6 +88,9 @@ def get_user_history(user_id: Annotated[str, Depends(is_authenticated)]):
     return {
         "total": len(formatted_history),
         "history": formatted_history,
+        "next_before": (
+            history[-1]["searched_at"].isoformat() if len(history) == limit else None
+        ),
         "message": "Search history fetched successfully",
     }
 
@@ -49,10 +98,9 @@ def get_user_history(user_id: Annotated[str, Depends(is_authenticated)]):
 # endpoint to clear user history
 @profile_router.delete("/me/history")
 def clear_user_history(user_id: Annotated[str, Depends(is_authenticated)]):
+    history_recorder.discard(user_id)
     result = user_history_collection.delete_many({"user_id": ObjectId(user_id)})
     return {
         "deleted_count": result.deleted_count,
         "message": "User history cleared successfully",
     }
-
-"""
\ No newline at end of file
@@ -1,15 +1,36 @@
-from fastapi import APIRouter, HTTPException, status
-from db import pharmacies_collection, med_inventory_collection
+import math
+from typing import Annotated
+from fastapi import APIRouter, HTTPException, Query, status
+from pydantic import BaseModel, Field
+from db import catalog_pharmacies_collection, catalog_inventory_collection
 from bson import ObjectId
-from utils import replace_mongo_id
+from services.singleflight import SingleFlight
+from utils import format_inventory_item, replace_mongo_id
 
 public_router = APIRouter(tags=["Public"], prefix="/public")
+# Concurrent requests for the same hot item share one round of queries
+ads_flight = SingleFlight("pharmacy_ads")
+medicine_flight = SingleFlight("medicine")
+
+# Map viewport listing: below CLUSTER_BELOW_ZOOM (or past MAX_POINTS
+# pharmacies) points are grouped into grid cells, CELLS_PER_TILE per map
+# tile side, and never more than about MAX_CLUSTERS cells per viewport
+CLUSTER_BELOW_ZOOM = 12
+CELLS_PER_TILE = 4
+MAX_CLUSTERS = 400
+MAX_POINTS = 500
+# Ids accepted by one batchGet call
+MAX_BATCH_IDS = 300
+# Polygon edges are geodesic; short edges plus a margin keep them from
+# cutting into the viewport, and the exact lat/lon range trims the rest
+EDGE_STEP_DEGREES = 10
+EDGE_MARGIN_DEGREES = 0.5
 
 
 # Get all pharmacies (public view)
 @public_router.get("/pharmacies/all")
 def get_all_pharmacies():
-    pharmacies = list(pharmacies_collection.find({}))
+    pharmacies = list(catalog_pharmacies_collection.find({}))
     pharm_list = []
 
     for pharmacy in pharmacies:
@@ -25,21 +46,220 @@ def get_all_pharmacies():
     }
 
 
+def parse_corner(corner):
+    try:
+        lat, lon = (float(part) for part in corner.split(","))
+    except ValueError:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, "Corners must be given as 'lat,lon'"
+        )
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Corner out of range")
+    return lat, lon
+
+
+def viewport_ring(south, west, north, east):
+    south = max(south - EDGE_MARGIN_DEGREES, -90)
+    north = min(north + EDGE_MARGIN_DEGREES, 90)
+    steps = max(1, math.ceil((east - west) / EDGE_STEP_DEGREES))
+    lons = [west + (east - west) * i / steps for i in range(steps + 1)]
+    ring = [[lon, south] for lon in lons] + [[lon, north] for lon in reversed(lons)]
+    return ring + [ring[0]]
+
+
+def build_bounds_filter(south, west, north, east):
+    """Filter pharmacies inside a viewport, which may cross the antimeridian."""
+    bounds_filter = {"gps_location.lat": {"$gte": south, "$lte": north}}
+    if west <= east:
+        bounds_filter["gps_location.lon"] = {"$gte": west, "$lte": east}
+        spans = [(west, east)]
+    else:
+        bounds_filter["$or"] = [
+            {"gps_location.lon": {"$gte": west}},
+            {"gps_location.lon": {"$lte": east}},
+        ]
+        spans = [(west, 180), (-180, east)]
+    # A polygon cannot span half the globe; such views show nearly every
+    # pharmacy anyway and are clustered
+    if any(span_east - span_west >= 180 for span_west, span_east in spans):
+        return bounds_filter
+    # A zero-width span has no area for a valid loop; the exact lon range
+    # above already limits it to the one meridian
+    spans = [(span_w, span_e) for span_w, span_e in spans if span_e > span_w]
+    if not spans:
+        return bounds_filter
+    rings = [viewport_ring(south, w, north, e) for w, e in spans]
+    if len(rings) == 1:
+        geometry = {"type": "Polygon", "coordinates": rings}
+    else:
+        geometry = {"type": "MultiPolygon", "coordinates": [[ring] for ring in rings]}
+    bounds_filter["location"] = {"$geoWithin": {"$geometry": geometry}}
+    return bounds_filter
+
+
+def cluster_pharmacies(bounds_filter, cell):
+    pipeline = [
+        {"$match": bounds_filter},
+        {
+            "$group": {
+                "_id": {
+                    "x": {"$floor": {"$divide": ["$gps_location.lon", cell]}},
+                    "y": {"$floor": {"$divide": ["$gps_location.lat", cell]}},
+                },
+                "count": {"$sum": 1},
+                "lat": {"$avg": "$gps_location.lat"},
+                "lon": {"$avg": "$gps_location.lon"},
+                "pharmacy_id": {"$first": "$_id"},
+            }
+        },
+    ]
+    clusters = []
+    for group in catalog_pharmacies_collection.aggregate(pipeline):
+        cluster = {"count": group["count"], "lat": group["lat"], "lon": group["lon"]}
+        if group["count"] == 1:
+            cluster["pharmacy_id"] = str(group["pharmacy_id"])
+        clusters.append(cluster)
+    return clusters
+
+
+# Pharmacies (or clusters of them) inside a map viewport; declared before
+# /pharmacies/{pharmacy_id} so "in-bounds" is not taken for an ID
+@public_router.get("/pharmacies/in-bounds")
+def get_pharmacies_in_bounds(
+    sw: Annotated[str, Query(description="South-west corner as 'lat,lon'")],
+    ne: Annotated[str, Query(description="North-east corner as 'lat,lon'")],
+    zoom: Annotated[int, Query(ge=0, le=22)],
+):
+    south, west = parse_corner(sw)
+    north, east = parse_corner(ne)
+    if south > north:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, "South-west corner must be below north-east"
+        )
+    bounds_filter = build_bounds_filter(south, west, north, east)
+
+    if zoom >= CLUSTER_BELOW_ZOOM:
+        pharmacies = list(
+            catalog_pharmacies_collection.find(
+                bounds_filter,
+                {"pharmacy_name": 1, "digital_address": 1, "gps_location": 1},
+            ).limit(MAX_POINTS + 1)
+        )
+        if len(pharmacies) <= MAX_POINTS:
+            return {
+                "zoom": zoom,
+                "clustered": False,
+                "total": len(pharmacies),
+                "pharmacies": [replace_mongo_id(doc) for doc in pharmacies],
+            }
+
+    width = east - west if west <= east else east - west + 360
+    height = north - south
+    cell = max(
+        360 / 2**zoom / CELLS_PER_TILE,
+        math.sqrt(width * height / MAX_CLUSTERS),
+    )
+    clusters = cluster_pharmacies(bounds_filter, cell)
+    return {
+        "zoom": zoom,
+        "clustered": True,
+        "total": sum(cluster["count"] for cluster in clusters),
+        "clusters": clusters,
+    }
+
+
+def format_pharmacy(pharmacy):
+    item = replace_mongo_id(pharmacy)
+    if "user_id" in item:
+        item["user_id"] = str(item["user_id"])
+    return item
+
+
+def format_medicine(medicine):
+    # Replace Mongo _id → id
+    med = replace_mongo_id(medicine)
+
+    # Convert pharmacy_id safely
+    pharmacy_id = med.get("pharmacy_id")
+    if isinstance(pharmacy_id, ObjectId):
+        pharmacy_id = str(pharmacy_id)
+    med["pharmacy_id"] = pharmacy_id
+
+    # Pharmacy details are embedded in the medicine document
+    pharmacy = med.get("pharmacy")
+
+    # Build the clean response structure
+    return {
+        "medicine": {
+            "id": med.get("id"),
+            "name": med.get("medicine_name"),
+            "price": med.get("price"),
+            "quantity": med.get("quantity"),
+            "category": med.get("category"),
+            "description": med.get("description"),
+            "flyer": med.get("flyer"),
+            "updated_at": med.get("updated_at"),
+        },
+        "pharmacy": {
+            "pharmacy_name": pharmacy.get("pharmacy_name") if pharmacy else None,
+            "digital_address": pharmacy.get("digital_address") if pharmacy else None,
+            "gps_location": pharmacy.get("gps_location") if pharmacy else None,
+        },
+    }
+
+
+class BatchGetRequest(BaseModel):
+    ids: list[str] = Field(min_length=1, max_length=MAX_BATCH_IDS)
+
+
+def batch_get(collection, ids, format_doc):
+    """Resolve ids with one $in query, answering in request order.
+
+    Unknown or malformed ids get a not-found marker instead of failing
+    the whole batch.
+    """
+    wanted = {ObjectId(doc_id) for doc_id in ids if ObjectId.is_valid(doc_id)}
+    docs = {doc["_id"]: doc for doc in collection.find({"_id": {"$in": list(wanted)}})}
+    results = []
+    for doc_id in ids:
+        doc = docs.get(ObjectId(doc_id)) if ObjectId.is_valid(doc_id) else None
+        if doc is None:
+            results.append({"id": doc_id, "found": False})
+        else:
+            # Formatters rename _id, so repeated ids each get a copy
+            results.append({"id": doc_id, "found": True, "data": format_doc(dict(doc))})
+    return {
+        "results": results,
+        "found": sum(result["found"] for result in results),
+        "missing": sum(not result["found"] for result in results),
+    }
+
+
+# Several cards' worth of medicines or pharmacies in one request
+@public_router.post("/medicines:batchGet")
+def batch_get_medicines(request: BatchGetRequest):
+    return batch_get(catalog_inventory_collection, request.ids, format_medicine)
+
+
+@public_router.post("/pharmacies:batchGet")
+def batch_get_pharmacies(request: BatchGetRequest):
+    return batch_get(catalog_pharmacies_collection, request.ids, format_pharmacy)
+
+
 # Get a single pharmacy by ID
 @public_router.get("/pharmacies/{pharmacy_id}")
 def get_pharmacy_by_id(pharmacy_id: str):
     if not ObjectId.is_valid(pharmacy_id):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid pharmacy ID format")
 
-    pharmacy = pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
+    pharmacy = catalog_pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
     if not pharmacy:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Pharmacy not found")
 
-    item = replace_mongo_id(pharmacy)
-    if "user_id" in item:
-        item["user_id"] = str(item["user_id"])
-
-    return {"data": item, "message": "Pharmacy fetched successfully."}
+    return {
+        "data": format_pharmacy(pharmacy),
+        "message": "Pharmacy fetched successfully.",
+    }
 
 
 @public_router.get("/pharmacies/{pharmacy_id}/ads")
@@ -50,41 +270,37 @@ def get_medicines_by_pharmacy(pharmacy_id: str):
             status.HTTP_400_BAD_REQUEST, detail="Invalid pharmacy ID format"
         )
 
-    # Get pharmacy info
-    pharmacy = pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
-    if not pharmacy:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Pharmacy not found")
+    return ads_flight.do(
+        str(ObjectId(pharmacy_id)), lambda: load_pharmacy_ads(pharmacy_id)
+    )
+
 
-    # Get all medicines that belong to this pharmacy
+def load_pharmacy_ads(pharmacy_id):
+    # Get all medicines that belong to this pharmacy, with the pharmacy
+    # summary embedded in each item
     medicines = list(
-        med_inventory_collection.find({"pharmacy_id": ObjectId(pharmacy_id)})
+        catalog_inventory_collection.find(
+            {"pharmacy_id": ObjectId(pharmacy_id), "pharmacy": {"$ne": None}}
+        )
     )
 
     if not medicines:
+        # Only look the pharmacy up when there is nothing to read it from
+        pharmacy = catalog_pharmacies_collection.find_one(
+            {"_id": ObjectId(pharmacy_id)}
+        )
+        if not pharmacy:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Pharmacy not found")
         return {
             "total": 0,
             "data": [],
             "message": f"No ads found for {pharmacy.get('pharmacy_name')}.",
         }
 
-    # Convert ObjectIds and build response list
-    med_list = []
-    for med in medicines:
-        # Convert MongoDB document safely
-        item = replace_mongo_id(med)
-
-        # Convert pharmacy_id if it exists
-        if "pharmacy_id" in item:
-            item["pharmacy_id"] = str(item["pharmacy_id"])
-
-        # Attach pharmacy info (for frontend display)
-        item["pharmacy"] = {
-            "pharmacy_name": pharmacy.get("pharmacy_name"),
-            "digital_address": pharmacy.get("digital_address"),
-            "gps_location": pharmacy.get("gps_location"),
-        }
+    pharmacy = medicines[0]["pharmacy"]
 
-        med_list.append(item)
+    # Build the response list from the public fields only
+    med_list = [format_inventory_item(med) for med in medicines]
 
     # Return the final JSON response
     return {
@@ -103,45 +319,19 @@ def get_medicine_by_id(medicine_id: str):
             detail="Invalid medicine ID format",
         )
 
+    return medicine_flight.do(
+        str(ObjectId(medicine_id)), lambda: load_medicine(medicine_id)
+    )
+
+
+def load_medicine(medicine_id):
     # Find the medicine document
-    medicine = med_inventory_collection.find_one({"_id": ObjectId(medicine_id)})
+    medicine = catalog_inventory_collection.find_one({"_id": ObjectId(medicine_id)})
     if not medicine:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Medicine not found")
 
-    # Replace Mongo _id → id
-    med = replace_mongo_id(medicine)
-
-    # Convert pharmacy_id safely
-    pharmacy_id = med.get("pharmacy_id")
-    if isinstance(pharmacy_id, ObjectId):
-        pharmacy_id = str(pharmacy_id)
-    med["pharmacy_id"] = pharmacy_id
-
-    # Get the pharmacy details
-    pharmacy = (
-        pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
-        if pharmacy_id
-        else None
+    response = format_medicine(medicine)
+    response["message"] = (
+        f"Fetched medicine '{response['medicine']['name']}' successfully."
     )
-
-    # Build the clean response structure
-    response = {
-        "medicine": {
-            "id": med.get("id"),
-            "name": med.get("medicine_name"),
-            "price": med.get("price"),
-            "quantity": med.get("quantity"),
-            "category": med.get("category"),
-            "description": med.get("description"),
-            "flyer": med.get("flyer"),
-            "updated_at": med.get("updated_at"),
-        },
-        "pharmacy": {
-            "pharmacy_name": pharmacy.get("pharmacy_name") if pharmacy else None,
-            "digital_address": pharmacy.get("digital_address") if pharmacy else None,
-            "gps_location": pharmacy.get("gps_location") if pharmacy else None,
-        },
-        "message": f"Fetched medicine '{med.get('medicine_name')}' successfully.",
-    }
-
     return response
@@ -76,20 +76,36 @@ def get_saved_pharmacies(
     if not saved:
         raise HTTPException(status_code=404, detail="No saved pharmacies found")
 
+    # Fetch every saved pharmacy and its owner in one query each
+    pharmacies = {
+        pharmacy["_id"]: pharmacy
+        for pharmacy in pharmacies_collection.find(
+            {"_id": {"$in": [item["pharmacy_id"] for item in saved]}}
+        )
+    }
+    owners = {
+        owner["_id"]: owner
+        for owner in users_collection.find(
+            {"_id": {"$in": [p["user_id"] for p in pharmacies.values()]}},
+            {"email": 1, "phone": 1},
+        )
+    }
     result = []
     for item in saved:
-        pharmacy = pharmacies_collection.find_one({"_id": item["pharmacy_id"]})
-        pharmacy_user_info = users_collection.find_one({"_id": pharmacy["user_id"]})
-        if pharmacy:
-            result.append(
-                {
-                    "pharmacy_id": str(pharmacy["_id"]),
-                    "name": pharmacy.get("pharmacy_name"),
-                    "email": pharmacy_user_info.get("email"),
-                    "address": pharmacy.get("digital_address"),
-                    "phone": pharmacy_user_info.get("phone"),
-                    "saved_at": item["saved_at"].isoformat(),
-                }
-            )
+        # Only entries orphaned before deletes cascaded can miss here
+        pharmacy = pharmacies.get(item["pharmacy_id"])
+        if not pharmacy:
+            continue
+        pharmacy_user_info = owners.get(pharmacy["user_id"], {})
+        result.append(
+            {
+                "pharmacy_id": str(pharmacy["_id"]),
+                "name": pharmacy.get("pharmacy_name"),
+                "email": pharmacy_user_info.get("email"),
+                "address": pharmacy.get("digital_address"),
+                "phone": pharmacy_user_info.get("phone"),
+                "saved_at": item["saved_at"].isoformat(),
+            }
+        )
 
     return {"saved_pharmacies": result}
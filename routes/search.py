@@ -1,75 +1,439 @@
-from fastapi import APIRouter, HTTPException, status
-from db import med_inventory_collection, pharmacies_collection
-from bson import ObjectId
+import re
+from enum import Enum
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from pydantic import BaseModel, Field
+from config import settings
+from db import catalog_inventory_collection, med_inventory_collection
+from dependencies.authn import optional_user_id
+from services.history import history_recorder
+from services.trending import trending_tracker
+from services.name_index import medicine_names
+from services.cache import search_cache
+from services.singleflight import SingleFlight
+from utils import name_tokens, normalize_name
 
 search_router = APIRouter(tags=["Search"], prefix="/search")
+search_flight = SingleFlight("search")
+# A miss right after an inventory change is cached under the new version,
+# so it must not be served by a secondary still missing that change;
+# cached searches read the primary and the cache takes the load off it
+search_inventory_collection = (
+    med_inventory_collection
+    if settings.search_cache_size > 0
+    else catalog_inventory_collection
+)
+
+
+class SearchSort(str, Enum):
+    PRICE_ASC = "price_asc"
+    PRICE_DESC = "price_desc"
+    RECENT = "recent"
+    DISTANCE = "distance"
+
+
+SORT_SPECS = {
+    SearchSort.PRICE_ASC: {"price": 1, "_id": 1},
+    SearchSort.PRICE_DESC: {"price": -1, "_id": -1},
+    SearchSort.RECENT: {"updated_at": -1, "_id": -1},
+    SearchSort.DISTANCE: {"distance": 1, "_id": 1},
+}
+
+# Lower bounds of the price facet buckets; prices above the last one
+# are counted in an open-ended bucket
+PRICE_BUCKETS = [0, 5, 10, 20, 50, 100, 200, 500]
+
+
+def build_search_filter(
+    query, category=None, min_price=None, max_price=None, in_stock=True, prefix=False
+):
+    search_filter = {"pharmacy": {"$ne": None}}
+    tokens = name_tokens(query or "")
+    if tokens:
+        # Whole words are equality matches on the multikey name_tokens
+        # index, which then also yields the price order. With prefix, the
+        # last word may still be being typed and matches as a key range.
+        *words, last = tokens
+        if prefix:
+            last = {"$regex": "^" + re.escape(last)}
+        conditions = [{"name_tokens": word} for word in [*words, last]]
+        if len(conditions) == 1:
+            search_filter.update(conditions[0])
+        else:
+            search_filter["$and"] = conditions
+    if category:
+        search_filter["category"] = category
+    price_range = {}
+    if min_price is not None:
+        price_range["$gte"] = min_price
+    if max_price is not None:
+        price_range["$lte"] = max_price
+    if price_range:
+        search_filter["price"] = price_range
+    if in_stock:
+        search_filter["quantity"] = {"$gt": 0}
+    return search_filter
+
+
+def build_search_pipeline(search_filter, sort, skip, limit, lat=None, lon=None):
+    if sort == SearchSort.DISTANCE:
+        # $geoNear must open the pipeline and applies the filter itself
+        pipeline = [
+            {
+                "$geoNear": {
+                    "near": {"type": "Point", "coordinates": [lon, lat]},
+                    "distanceField": "distance",
+                    "key": "pharmacy.location",
+                    "query": search_filter,
+                    "spherical": True,
+                }
+            }
+        ]
+    else:
+        pipeline = [{"$match": search_filter}]
+    # Sorted ahead of $facet, whose sub-pipelines never use an index, so an
+    # index ending in (price, _id) or (updated_at, _id) can serve it; ties
+    # break on _id in the direction those indexes scan. Only equality
+    # filters ahead of those fields let it, so a prefix search sorts its
+    # matches in memory.
+    pipeline.append({"$sort": SORT_SPECS[sort]})
+    pipeline.append(
+        {
+            "$facet": {
+                "results": [{"$skip": skip}, {"$limit": limit}],
+                "total": [{"$count": "count"}],
+                "categories": [
+                    {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1, "_id": 1}},
+                ],
+                "price_buckets": [
+                    {
+                        "$bucket": {
+                            "groupBy": "$price",
+                            "boundaries": PRICE_BUCKETS + [float("inf")],
+                            "default": "other",
+                            "output": {"count": {"$sum": 1}},
+                        }
+                    }
+                ],
+            }
+        }
+    )
+    return pipeline
+
+
+def format_search_result(med):
+    pharmacy = med["pharmacy"]
+    result = {
+        "medicine_id": str(med["_id"]),
+        "medicine_name": med.get("medicine_name"),
+        "price": med.get("price"),
+        "quantity": med.get("quantity"),
+        "description": med.get("description"),
+        "category": med.get("category"),
+        "flyer": med.get("flyer"),
+        "updated_at": med.get("updated_at"),
+        "pharmacy": {
+            "pharmacy_name": pharmacy.get("pharmacy_name"),
+            "digital_address": pharmacy.get("digital_address"),
+            "gps_location": pharmacy.get("gps_location"),
+            # "phone": pharmacy.get("phone", None),
+        },
+    }
+    if "distance" in med:
+        result["distance_km"] = round(med["distance"] / 1000, 2)
+    return result
+
+
+def format_price_bucket(bucket):
+    lower = bucket["_id"]
+    if lower == PRICE_BUCKETS[-1]:
+        label = f"{lower}+"
+    elif lower in PRICE_BUCKETS:
+        label = f"{lower}-{PRICE_BUCKETS[PRICE_BUCKETS.index(lower) + 1]}"
+    else:
+        label = "unknown"
+    return {"range": label, "count": bucket["count"]}
 
 
 @search_router.get("/medicine")
-def search_medicine(query: str = ""):
-    """Search for medicines by name"""
-    if not query:
+def search_medicine(
+    query: str = "",
+    category: str | None = None,
+    min_price: Annotated[float | None, Query(ge=0)] = None,
+    max_price: Annotated[float | None, Query(ge=0)] = None,
+    in_stock: bool = True,
+    sort: SearchSort = SearchSort.PRICE_ASC,
+    lat: float | None = None,
+    lon: float | None = None,
+    page: Annotated[int, Query(ge=1)] = 1,
+    page_size: Annotated[int, Query(ge=1, le=100)] = 20,
+    user_id: Annotated[str | None, Depends(optional_user_id)] = None,
+):
+    """Search for medicines by name with filters, sorting and facet counts"""
+    if not query and not category:
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST,
             "Search query cannot be empty. Please provide a medicine name.",
         )
+    if sort == SearchSort.DISTANCE and (lat is None or lon is None):
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            "Provide lat and lon to sort results by distance.",
+        )
 
-    medicines = list(
-        med_inventory_collection.find(
-            {
-                "medicine_name": {"$regex": query, "$options": "i"},
-                "quantity": {"$gt": 0},
-            }
+    # Recorded in the background, batched with other users' searches
+    if user_id and query:
+        history_recorder.record(user_id, query.strip())
+
+    def run_search(name, prefix=False):
+        search_filter = build_search_filter(
+            name, category, min_price, max_price, in_stock, prefix
         )
+        pipeline = build_search_pipeline(
+            search_filter, sort, (page - 1) * page_size, page_size, lat, lon
+        )
+        return next(search_inventory_collection.aggregate(pipeline), None) or {}
+
+    def compute():
+        facets = run_search(query)
+        total = facets["total"][0]["count"] if facets.get("total") else 0
+        if not total and query:
+            # A query cut off mid-word, as typed
+            facets = run_search(query, prefix=True)
+            total = facets["total"][0]["count"] if facets.get("total") else 0
+        # Fall back to the closest known name when a misspelled query finds
+        # nothing, instead of making the patient retry
+        close_matches = []
+        if not total and query:
+            close_matches = medicine_names.fuzzy(query)
+            if close_matches:
+                facets = run_search(close_matches[0]["name"])
+                total = facets["total"][0]["count"] if facets.get("total") else 0
+        return facets, total, close_matches
+
+    # Identical searches share one set of queries, whether they arrive
+    # together or while the inventory is unchanged
+    key = (
+        normalize_name(query),
+        category,
+        min_price,
+        max_price,
+        in_stock,
+        sort,
+        lat,
+        lon,
+        page,
+        page_size,
     )
+    # Cached pages are dropped as soon as any inventory changes
+    version = search_cache.version()
+    cached = search_cache.get(key, version)
+    if cached is None:
+        cached = search_flight.do((version, key), compute)
+        search_cache.put(key, version, cached)
+    facets, total, close_matches = cached
+    did_you_mean = close_matches[0]["name"] if close_matches else None
 
-    results = []
-    for med in medicines:
-        pharmacy_id = med.get("pharmacy_id")
-        if not pharmacy_id or not ObjectId.is_valid(pharmacy_id):
-            continue
+    if total and query:
+        trending_tracker.record(did_you_mean or query)
 
-        pharmacy = pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
-        if not pharmacy:
-            continue
+    results = [format_search_result(med) for med in facets.get("results", [])]
+    response = {
+        "total_results": total,
+        "page": page,
+        "page_size": page_size,
+        "results": results,
+        "facets": {
+            "categories": [
+                {"category": c["_id"], "count": c["count"]}
+                for c in facets.get("categories", [])
+            ],
+            "price_buckets": [
+                format_price_bucket(b) for b in facets.get("price_buckets", [])
+            ],
+        },
+    }
+    if did_you_mean:
+        response["did_you_mean"] = did_you_mean
+        response["suggestions"] = [match["name"] for match in close_matches]
+    if not total:
+        response["message"] = f"No medicines found for '{query or category}'."
+    elif did_you_mean:
+        response["message"] = (
+            f"No medicines found for '{query}'. "
+            f"Showing results for '{did_you_mean}'."
+        )
+    return response
 
-        results.append({
-            "medicine_id": str(med["_id"]),
-            "medicine_name": med.get("medicine_name"),
-            "price": med.get("price"),
-            "quantity": med.get("quantity"),
-            "description": med.get("description"),
-            "category": med.get("category"),
-            "flyer": med.get("flyer"),
+
+class BasketItem(BaseModel):
+    name: str = Field(min_length=1)
+    quantity: int = Field(default=1, ge=1)
+
+
+class BasketRequest(BaseModel):
+    items: list[BasketItem] = Field(min_length=1, max_length=50)
+    lat: float | None = None
+    lon: float | None = None
+    limit: int = Field(default=10, ge=1, le=50)
+
+
+def build_basket_pipeline(wanted, limit, lat=None, lon=None):
+    basket_filter = {
+        "name_key": {"$in": list(wanted)},
+        "quantity": {"$gt": 0},
+        "pharmacy": {"$ne": None},
+    }
+    if lat is not None and lon is not None:
+        first_stage = {
+            "$geoNear": {
+                "near": {"type": "Point", "coordinates": [lon, lat]},
+                "distanceField": "distance",
+                "key": "pharmacy.location",
+                "query": basket_filter,
+                "spherical": True,
+            }
+        }
+    else:
+        first_stage = {"$match": basket_filter}
+    return [
+        first_stage,
+        {
+            "$addFields": {
+                "wanted": {
+                    "$switch": {
+                        "branches": [
+                            {"case": {"$eq": ["$name_key", key]}, "then": quantity}
+                            for key, quantity in wanted.items()
+                        ],
+                        "default": 0,
+                    }
+                }
+            }
+        },
+        {"$addFields": {"filled": {"$min": ["$quantity", "$wanted"]}}},
+        # Keep only the cheapest listing of each medicine per pharmacy
+        {"$sort": {"price": 1, "_id": 1}},
+        {
+            "$group": {
+                "_id": {"pharmacy_id": "$pharmacy_id", "name_key": "$name_key"},
+                "item": {"$first": "$$ROOT"},
+            }
+        },
+        {"$replaceRoot": {"newRoot": "$item"}},
+        {
+            "$group": {
+                "_id": "$pharmacy_id",
+                "pharmacy": {"$first": "$pharmacy"},
+                "distance": {"$first": "$distance"},
+                "items_available": {"$sum": 1},
+                "items_fully_available": {
+                    "$sum": {"$cond": [{"$gte": ["$quantity", "$wanted"]}, 1, 0]}
+                },
+                "units_filled": {"$sum": "$filled"},
+                "total_price": {"$sum": {"$multiply": ["$price", "$filled"]}},
+                "items": {
+                    "$push": {
+                        "medicine_id": {"$toString": "$_id"},
+                        "medicine_name": "$medicine_name",
+                        "name_key": "$name_key",
+                        "price": "$price",
+                        "requested": "$wanted",
+                        "available": "$quantity",
+                    }
+                },
+            }
+        },
+        {
+            "$sort": {
+                "units_filled": -1,
+                "total_price": 1,
+                "distance": 1,
+                "_id": 1,
+            }
+        },
+        {"$limit": limit},
+    ]
+
+
+@search_router.post("/basket")
+def search_basket(basket: BasketRequest):
+    """Rank pharmacies by how much of a list of medicines they can fill"""
+    if (basket.lat is None) != (basket.lon is None):
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, "Provide both lat and lon, or neither."
+        )
+    # Merge repeated names into one requested quantity
+    wanted = {}
+    names = {}
+    for item in basket.items:
+        key = normalize_name(item.name)
+        wanted[key] = wanted.get(key, 0) + item.quantity
+        names.setdefault(key, item.name)
+    total_units = sum(wanted.values())
+
+    pipeline = build_basket_pipeline(wanted, basket.limit, basket.lat, basket.lon)
+    results = []
+    for group in catalog_inventory_collection.aggregate(pipeline):
+        found = set()
+        items = []
+        for item in group["items"]:
+            found.add(item.pop("name_key"))
+            items.append(item)
+        pharmacy = group["pharmacy"]
+        result = {
+            "pharmacy_id": str(group["_id"]),
             "pharmacy": {
                 "pharmacy_name": pharmacy.get("pharmacy_name"),
                 "digital_address": pharmacy.get("digital_address"),
                 "gps_location": pharmacy.get("gps_location"),
-                # "phone": pharmacy.get("phone", None),
             },
-        })
+            "coverage": round(group["units_filled"] / total_units, 4),
+            "items_available": group["items_available"],
+            "items_fully_available": group["items_fully_available"],
+            "total_price": round(group["total_price"], 2),
+            "items": items,
+            "missing": [names[key] for key in wanted if key not in found],
+        }
+        if group.get("distance") is not None:
+            result["distance_km"] = round(group["distance"] / 1000, 2)
+        results.append(result)
+
+    return {
+        "requested_items": len(wanted),
+        "total_results": len(results),
+        "results": results,
+    }
+
 
-    if not results:
-        return {"total_results": 0, "results": [], "message": f"No medicines found for '{query}'."}
+# Plain def, so waiting on the name index lock blocks a threadpool worker
+# rather than the event loop
+@search_router.get("/suggest")
+def suggest_medicines(prefix: str = "", limit: int = 10):
+    """Autocomplete medicine names from the in-memory name index"""
+    if not prefix.strip():
+        return {"prefix": prefix, "suggestions": []}
+    return {
+        "prefix": prefix,
+        "suggestions": medicine_names.suggest(prefix, min(max(limit, 1), 50)),
+    }
 
-    return {"total_results": len(results), "results": results}
+
+@search_router.get("/trending")
+async def get_trending_searches(limit: Annotated[int, Query(ge=1, le=50)] = 10):
+    """Most searched medicines over the recent window, served from memory"""
+    return {"trending": trending_tracker.trending(limit)}
 
 
 @search_router.get("/all")
 def get_all_medicines():
     """Fetch all medicines from all pharmacies"""
-    medicines = list(med_inventory_collection.find())
+    medicines = list(catalog_inventory_collection.find({"pharmacy": {"$ne": None}}))
     med_list = []
 
     for med in medicines:
-        pharmacy_id = med.get("pharmacy_id")
-        if not pharmacy_id or not ObjectId.is_valid(pharmacy_id):
-            continue
-
-        pharmacy = pharmacies_collection.find_one({"_id": ObjectId(pharmacy_id)})
-        if not pharmacy:
-            continue
-
+        pharmacy = med["pharmacy"]
         med_list.append({
             "medicine_id": str(med["_id"]),
             "medicine_name": med.get("medicine_name"),
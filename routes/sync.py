@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+from typing import Annotated
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Query, status
+from config import settings
+from db import inventory_tombstones_collection, med_inventory_collection
+from services.sync import SETTLE_TIME, decode_sync_token, encode_sync_token
+
+sync_router = APIRouter(tags=["Sync"], prefix="/sync")
+
+
+def build_log_filter(field, position, until):
+    # Documents after position, a (time, _id) pair, up to until
+    log_filter = {field: {"$lte": until}}
+    if position is not None:
+        moment, last_id = position
+        log_filter[field]["$gte"] = moment
+        log_filter["$nor"] = [{field: moment, "_id": {"$lte": last_id}}]
+    return log_filter
+
+
+def read_log(collection, field, position, until, limit):
+    log_filter = build_log_filter(field, position, until)
+    docs = list(
+        collection.find(log_filter)
+        .sort([(field, 1), ("_id", 1)])
+        .limit(limit + 1)
+    )
+    return docs[:limit], len(docs) > limit
+
+
+def format_sync_item(med):
+    pharmacy = med.get("pharmacy") or {}
+    return {
+        "medicine_id": str(med["_id"]),
+        "pharmacy_id": str(med["pharmacy_id"]),
+        "medicine_name": med.get("medicine_name"),
+        "price": med.get("price"),
+        "quantity": med.get("quantity"),
+        "description": med.get("description"),
+        "category": med.get("category"),
+        "flyer": med.get("flyer"),
+        "updated_at": med.get("updated_at"),
+        "pharmacy": {
+            "pharmacy_name": pharmacy.get("pharmacy_name"),
+            "digital_address": pharmacy.get("digital_address"),
+            "gps_location": pharmacy.get("gps_location"),
+        },
+    }
+
+
+@sync_router.get("/inventory")
+def sync_inventory(
+    since: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=500)] = 200,
+):
+    """Medicines changed or deleted since the token of a previous sync.
+
+    Without a token the whole catalog is returned, a page at a time.
+    Keep calling with next_token while has_more is true, then store it
+    for the next refresh. A 410 means the token is older than the kept
+    deletions and the client has to start over without one.
+    """
+    now = datetime.now(tz=timezone.utc)
+    until = now - SETTLE_TIME
+    if since:
+        try:
+            updated, deleted = decode_sync_token(since)
+        except ValueError:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid sync token")
+        if deleted[0] < now - timedelta(days=settings.sync_tombstone_days):
+            raise HTTPException(
+                status.HTTP_410_GONE, "Sync token expired, sync again from scratch"
+            )
+    else:
+        # A fresh copy needs no deletions from before it was taken
+        updated, deleted = None, (until, ObjectId("0" * 24))
+
+    # Both logs come from the primary: a lagging secondary would move the
+    # token past writes it has not replicated yet
+    changed, more_changed = read_log(
+        med_inventory_collection, "updated_at", updated, until, limit
+    )
+    removed, more_removed = read_log(
+        inventory_tombstones_collection, "deleted_at", deleted, until, limit
+    )
+    if changed:
+        updated = (changed[-1]["updated_at"], changed[-1]["_id"])
+    if more_removed:
+        deleted = (removed[-1]["deleted_at"], removed[-1]["_id"])
+    else:
+        # Every deletion up to "until" has been seen; moving the mark keeps
+        # tokens of quiet catalogs from expiring
+        deleted = (until, ObjectId("f" * 24))
+    return {
+        "changed": [format_sync_item(med) for med in changed],
+        "deleted": [str(tombstone["_id"]) for tombstone in removed],
+        "next_token": encode_sync_token(updated, deleted),
+        "has_more": more_changed or more_removed,
+    }
@@ -1,25 +1,26 @@
 from enum import Enum
-from fastapi import APIRouter, Form, status, HTTPException, UploadFile, File, Depends
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Form,
+    status,
+    HTTPException,
+    UploadFile,
+    File,
+    Depends,
+)
+from fastapi.concurrency import run_in_threadpool
 from typing import Annotated
 from pydantic import EmailStr
 from db import users_collection, pharmacies_collection
-import bcrypt
 import jwt
-from dotenv import load_dotenv
-import os
+from config import settings
 from datetime import timezone, datetime, timedelta
 from bson import ObjectId
-import cloudinary
-import cloudinary.uploader
-
-
-load_dotenv()
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-)
+from services.inbox import seed_unread
+from services.media import upload_image
+from services.passwords import hash_password, verify_password, needs_rehash
+from utils import geo_point
 
 
 class UserRole(str, Enum):
@@ -34,7 +35,7 @@ users_router = APIRouter(tags=["Users"])
 
 # Defining endpoints for users
 @users_router.post("/users/register")
-def register_users(
+async def register_users(
     email: Annotated[EmailStr, Form()],
     password: Annotated[str, Form(min_length=8)],
     username: Annotated[str, Form()],
@@ -47,22 +48,24 @@ def register_users(
     license_number: Annotated[str | None, Form()] = None,
 ):
     # ensure user does not exist in db
-    user_count = users_collection.count_documents(filter={"email": email})
+    user_count = await run_in_threadpool(
+        users_collection.count_documents, filter={"email": email}
+    )
     if user_count > 0:
         raise HTTPException(status.HTTP_409_CONFLICT, "User Already Exists!")
-    # Hash user password
-    hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    # Hash user password on the dedicated hashing pool
+    hashed_password = await hash_password(password)
     # Create a base user data
     user_doc = {
         "email": email,
-        "password": hashed_password.decode(),
+        "password": hashed_password,
         "username": username,
         "phone": phone,
         "role": role,
         "created_at": datetime.now(tz=timezone.utc),
     }
     # Insert user into users_collection in database
-    result = users_collection.insert_one(user_doc)
+    result = await run_in_threadpool(users_collection.insert_one, user_doc)
     user_id = result.inserted_id
     # If user is a pharmacy, save the additional pharmacy data
     if role == UserRole.PHARMACY:
@@ -72,42 +75,67 @@ def register_users(
                 "Pharmacy Should Provide Digital Address, GPS Location and Flyer",
             )
         # Upload flyer to cloudinary to get a url to be stored in mongo db
-        upload_result = cloudinary.uploader.upload(flyer.file)
-        print(upload_result)
-        pharmacies_collection.insert_one(
+        flyer_url = await run_in_threadpool(upload_image, flyer)
+        pharmacy = await run_in_threadpool(
+            pharmacies_collection.insert_one,
             {
                 "user_id": ObjectId(user_id),
                 "pharmacy_name": username,
-                "flyer": upload_result["secure_url"],
+                "flyer": flyer_url,
                 "digital_address": digital_address,
                 "gps_location": {"lat": latitude, "lon": longitude},
+                "location": geo_point({"lat": latitude, "lon": longitude}),
                 "license_number": license_number,
                 "created_at": datetime.now(tz=timezone.utc),
-            }
+            },
         )
+        await run_in_threadpool(seed_unread, pharmacy.inserted_id)
     # Return response
     return {"Message": f"{role.capitalize()} registered successfully!"}
 
 
+async def rehash_password(user_id: ObjectId, password: str, old_hash: str):
+    try:
+        new_hash = await hash_password(password)
+    except HTTPException:
+        # Hashing pool is saturated; the upgrade is retried on the next login
+        return
+    # Only replace the hash we verified against, in case it changed meanwhile
+    await run_in_threadpool(
+        users_collection.update_one,
+        {"_id": user_id, "password": old_hash},
+        {"$set": {"password": new_hash}},
+    )
+
+
 @users_router.post("/users/login")
-def login_user(email: Annotated[EmailStr, Form()], password: Annotated[str, Form()]):
+async def login_user(
+    email: Annotated[EmailStr, Form()],
+    password: Annotated[str, Form()],
+    background_tasks: BackgroundTasks,
+):
 
     # Ensure user does not exist
-    user = users_collection.find_one(filter={"email": email})
+    user = await run_in_threadpool(users_collection.find_one, filter={"email": email})
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User Not Found!")
     # Compare their passwords
     hashed_password_in_db = user["password"]
-    correct_password = bcrypt.checkpw(password.encode(), hashed_password_in_db.encode())
+    correct_password = await verify_password(password, hashed_password_in_db)
     if not correct_password:
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid login Credentials")
+    # Upgrade hashes created with an outdated cost factor after responding
+    if needs_rehash(hashed_password_in_db):
+        background_tasks.add_task(
+            rehash_password, user["_id"], password, hashed_password_in_db
+        )
     # Generate an access token for users
     encoded_jwt = jwt.encode(
         {
             "id": str(user["_id"]),
             "exp": datetime.now(tz=timezone.utc) + timedelta(minutes=60),
         },
-        os.getenv("JWT_SECRET_KEY"),
+        settings.jwt_secret_key,
         "HS256",
     )
 
@@ -0,0 +1,54 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Runs fn every interval seconds on a daemon thread.
+
+    wake() runs it early; stop() runs it one last time before returning so
+    buffered work is not lost on shutdown, unless run_on_stop is False.
+    """
+
+    def __init__(self, name, interval, fn, run_on_stop=True):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.run_on_stop = run_on_stop
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        if self.run_on_stop:
+            self._run()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stopped.is_set():
+                self._run()
+
+    def _run(self):
+        try:
+            self.fn()
+        except Exception:
+            logger.exception("Periodic task %s failed", self.name)
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from pymongo import ReturnDocument
+from config import settings
+from db import cache_versions_collection
+
+
+class LocalVersionStore:
+    """Inventory version counter for a single worker."""
+
+    def __init__(self):
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        return self._version
+
+    def bump(self):
+        with self._lock:
+            self._version += 1
+
+
+class MongoVersionStore:
+    """Inventory version counter shared by every worker through Mongo.
+
+    Reads are served from a copy refreshed at most every refresh_ms, so
+    another worker's write is seen within that delay; this worker's own
+    writes are seen immediately.
+    """
+
+    def __init__(self, collection, refresh_ms):
+        self.collection = collection
+        self.refresh = refresh_ms / 1000
+        self._version = None
+        self._read_at = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if self._version is None or now - self._read_at >= self.refresh:
+            doc = self.collection.find_one({"_id": "inventory"}, {"version": 1})
+            self._version = doc["version"] if doc else 0
+            self._read_at = now
+        return self._version
+
+    def bump(self):
+        doc = self.collection.find_one_and_update(
+            {"_id": "inventory"},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._version = doc["version"]
+        self._read_at = time.monotonic()
+
+
+class ResultCache:
+    """LRU cache with a TTL whose entries also expire on a version change.
+
+    Each entry remembers the inventory version it was computed at, so a
+    single bump() makes every cached result stale without walking them.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, versions):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.versions = versions
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self):
+        return self.versions.get()
+
+    def get(self, key, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_version, expires_at, value = entry
+            if entry_version != version or expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, version, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "version": self.versions.get(),
+            }
+
+
+def make_version_store():
+    if settings.cache_version_store == "mongo":
+        return MongoVersionStore(
+            cache_versions_collection, settings.cache_version_refresh_ms
+        )
+    return LocalVersionStore()
+
+
+inventory_versions = make_version_store()
+search_cache = ResultCache(
+    max_entries=settings.search_cache_size,
+    ttl_seconds=settings.search_cache_ttl_seconds,
+    versions=inventory_versions,
+)
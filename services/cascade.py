@@ -0,0 +1,213 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from config import settings
+from db import (
+    cart_collection,
+    cascade_jobs_collection,
+    inbox_counters_collection,
+    med_inventory_collection,
+    messages_collection,
+    pharmacies_collection,
+    prescriptions_collection,
+    saved_pharmacies_collection,
+    user_history_collection,
+)
+from services.cache import inventory_versions
+from services.inbox import drop_unread
+from services.name_index import medicine_names
+from services.price_stats import price_stats
+from services.projections import clear_pharmacy_summary
+from services.sync import record_deletions
+
+logger = logging.getLogger(__name__)
+
+# How long a worker owns a running job before another may take it over
+JOB_LEASE = timedelta(minutes=5)
+# Failed jobs stay runnable so a retry can finish the cleanup
+RUNNABLE = ["pending", "running", "failed"]
+
+
+def pharmacy_dependents(pharmacy_id):
+    # Inventory first so the pharmacy disappears from search right away
+    return [
+        ("inventory", med_inventory_collection, {"pharmacy_id": pharmacy_id}),
+        ("messages", messages_collection, {"pharmacy_id": pharmacy_id}),
+        ("prescriptions", prescriptions_collection, {"pharmacy_id": pharmacy_id}),
+        (
+            "saved_pharmacies",
+            saved_pharmacies_collection,
+            {"pharmacy_id": pharmacy_id},
+        ),
+        ("carts", cart_collection, {"pharmacy_id": str(pharmacy_id)}),
+        ("inbox_counters", inbox_counters_collection, {"_id": pharmacy_id}),
+    ]
+
+
+def user_dependents(user_id):
+    return [
+        ("carts", cart_collection, {"user_id": str(user_id)}),
+        ("messages", messages_collection, {"user_id": user_id}),
+        ("prescriptions", prescriptions_collection, {"user_id": user_id}),
+        ("saved_pharmacies", saved_pharmacies_collection, {"user_id": user_id}),
+        ("user_history", user_history_collection, {"user_id": user_id}),
+    ]
+
+
+def create_cascade_job(kind, target_id):
+    """Record a cleanup job for a deleted "user" or "pharmacy"."""
+    now = datetime.now(tz=timezone.utc)
+    result = cascade_jobs_collection.insert_one(
+        {
+            "kind": kind,
+            "target_id": target_id,
+            "status": "pending",
+            "progress": {},
+            "created_at": now,
+            "lease_until": now,
+        }
+    )
+    return result.inserted_id
+
+
+def _claim(job_id):
+    now = datetime.now(tz=timezone.utc)
+    return cascade_jobs_collection.find_one_and_update(
+        {
+            "_id": job_id,
+            "status": {"$in": RUNNABLE},
+            "lease_until": {"$lte": now},
+        },
+        {
+            "$set": {"status": "running", "lease_until": now + JOB_LEASE},
+            "$unset": {"error": ""},
+        },
+    )
+
+
+def _delete_in_batches(job_id, label, collection, dependents_filter):
+    # Inventory rows are also dropped from the in-memory name index and
+    # leave tombstones for delta sync; unread inbox items come off the
+    # pharmacy's counters
+    if label == "inventory":
+        projection = {
+            "medicine_name": 1,
+            "name_key": 1,
+            "quantity": 1,
+            "pharmacy_id": 1,
+        }
+    elif label in ("messages", "prescriptions"):
+        projection = {"pharmacy_id": 1, "is_read": 1}
+    else:
+        projection = {"_id": 1}
+    while True:
+        batch = list(
+            collection.find(dependents_filter, projection).limit(
+                settings.cascade_batch_size
+            )
+        )
+        if not batch:
+            return
+        if label == "inventory":
+            record_deletions(batch)
+        collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        if label == "inventory":
+            for doc in batch:
+                medicine_names.remove(doc.get("medicine_name"), doc.get("quantity"))
+            inventory_versions.bump()
+            price_stats.mark_dirty(*(doc.get("medicine_name") for doc in batch))
+        elif label in ("messages", "prescriptions"):
+            drop_unread(label, batch)
+        cascade_jobs_collection.update_one(
+            {"_id": job_id},
+            {
+                "$inc": {f"progress.{label}": len(batch)},
+                "$set": {"lease_until": datetime.now(tz=timezone.utc) + JOB_LEASE},
+            },
+        )
+
+
+def run_cascade_job(job_id):
+    job = _claim(job_id)
+    if job is None:
+        return
+    try:
+        target_id = job["target_id"]
+        if job["kind"] == "user":
+            dependents = user_dependents(target_id)
+            # A pharmacy account takes its pharmacy and that one's data along
+            pharmacy_ids = [
+                pharmacy["_id"]
+                for pharmacy in pharmacies_collection.find(
+                    {"user_id": target_id}, {"_id": 1}
+                )
+            ]
+            for pharmacy_id in pharmacy_ids:
+                dependents += pharmacy_dependents(pharmacy_id)
+                dependents.append(
+                    ("pharmacies", pharmacies_collection, {"_id": pharmacy_id})
+                )
+        else:
+            pharmacy_ids = [target_id]
+            dependents = pharmacy_dependents(target_id)
+        # Hide the listings from every read path before the slower deletes;
+        # a retried job hides whatever is left again
+        for pharmacy_id in pharmacy_ids:
+            clear_pharmacy_summary(pharmacy_id)
+        for label, collection, dependents_filter in dependents:
+            _delete_in_batches(job_id, label, collection, dependents_filter)
+    except Exception as error:
+        logger.exception("Cascade job %s failed", job_id)
+        cascade_jobs_collection.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": str(error),
+                    "lease_until": datetime.now(tz=timezone.utc),
+                }
+            },
+        )
+        return
+    cascade_jobs_collection.update_one(
+        {"_id": job_id},
+        {
+            "$set": {
+                "status": "done",
+                "finished_at": datetime.now(tz=timezone.utc),
+                "lease_until": None,
+            }
+        },
+    )
+
+
+def resume_cascade_jobs():
+    # Pick up jobs interrupted by a restart, and retry failed ones, without
+    # delaying startup
+    def resume():
+        now = datetime.now(tz=timezone.utc)
+        for job in cascade_jobs_collection.find(
+            {"status": {"$in": RUNNABLE}, "lease_until": {"$lte": now}},
+            {"_id": 1},
+        ):
+            run_cascade_job(job["_id"])
+
+    threading.Thread(target=resume, name="cascade-resume", daemon=True).start()
+
+
+def format_cascade_job(job):
+    return {
+        "job_id": str(job["_id"]),
+        "kind": job["kind"],
+        "target_id": str(job["target_id"]),
+        "status": job["status"],
+        "progress": job.get("progress", {}),
+        "created_at": job["created_at"],
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error"),
+    }
+
+
+def get_cascade_job(job_id):
+    return cascade_jobs_collection.find_one({"_id": ObjectId(job_id)})
@@ -0,0 +1,92 @@
+import base64
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import bson
+from pymongo.errors import OperationFailure
+from db import catalog_inventory_collection, med_inventory_collection, mongo_client
+
+CONSISTENCY_HEADER = "X-Consistency-Token"
+# Owners whose latest write token this worker remembers
+MAX_TRACKED_WRITERS = 10000
+
+
+class WriteTokens:
+    """Latest write token per user, for reads served by the same worker."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, user_id, token):
+        with self._lock:
+            self._tokens[user_id] = token
+            self._tokens.move_to_end(user_id)
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def get(self, user_id):
+        with self._lock:
+            return self._tokens.get(user_id)
+
+
+write_tokens = WriteTokens(MAX_TRACKED_WRITERS)
+
+
+def encode_token(session):
+    # Standalone servers have no cluster time, and reads there are current
+    if session.operation_time is None or session.cluster_time is None:
+        return None
+    raw = bson.encode(
+        {
+            "operationTime": session.operation_time,
+            "clusterTime": session.cluster_time,
+        }
+    )
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_token(token):
+    try:
+        times = bson.decode(base64.urlsafe_b64decode(token.encode()))
+        return times["operationTime"], times["clusterTime"]
+    except Exception:
+        return None
+
+
+@contextmanager
+def writer_session(user_id, response):
+    """Run a user's writes in a causally consistent session.
+
+    Afterwards the session's operation time is remembered for the user
+    and sent back in the X-Consistency-Token header.
+    """
+    with mongo_client.start_session(causal_consistency=True) as session:
+        yield session
+        token = encode_token(session)
+    if token:
+        write_tokens.remember(str(user_id), token)
+        response.headers[CONSISTENCY_HEADER] = token
+
+
+def read_your_writes(user_id, token, read):
+    """Call read(collection, session) so it sees the user's last write.
+
+    With a token from the request or remembered by this worker, the read
+    runs in a causally consistent session and may be served by any
+    member that has caught up with it. Otherwise, or if the server
+    rejects the token, it goes to the primary.
+    """
+    token = token or write_tokens.get(str(user_id))
+    times = decode_token(token) if token else None
+    if times:
+        operation_time, cluster_time = times
+        try:
+            with mongo_client.start_session(causal_consistency=True) as session:
+                session.advance_cluster_time(cluster_time)
+                session.advance_operation_time(operation_time)
+                return read(catalog_inventory_collection, session)
+        except OperationFailure:
+            pass
+    return read(med_inventory_collection, None)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import threading
+from pymongo.errors import PyMongoError
+from config import settings
+from db import messages_collection, prescriptions_collection
+
+logger = logging.getLogger(__name__)
+
+
+class EventBroker:
+    """In-process pub/sub of inbox events, one channel per pharmacy.
+
+    Subscribers are asyncio queues on the app's event loop; publish() is
+    safe to call from the threadpool running sync handlers.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._loop = None
+        self._subscribers = {}
+
+    def bind(self, loop):
+        self._loop = loop
+
+    def subscribe(self, channel):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(channel, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        queues = self._subscribers.get(channel)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._deliver, channel, event)
+
+    def _deliver(self, channel, event):
+        for queue in self._subscribers.get(channel, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A stalled client catches up by fetching deltas on reconnect
+                pass
+
+
+event_broker = EventBroker()
+
+
+def inbox_event(kind, doc):
+    if kind == "message":
+        return {
+            "type": "message",
+            "id": str(doc["_id"]),
+            "subject": doc.get("subject"),
+            "sent_at": doc["sent_at"].isoformat(),
+        }
+    return {
+        "type": "prescription",
+        "id": str(doc["_id"]),
+        "title": doc.get("title"),
+        "uploaded_at": doc["uploaded_at"].isoformat(),
+    }
+
+
+def publish_inbox_event(kind, doc):
+    # With change streams on, the watcher publishes on every worker instead
+    if not settings.inbox_change_streams:
+        event_broker.publish(str(doc["pharmacy_id"]), inbox_event(kind, doc))
+
+
+class ChangeStreamFanout:
+    """Relays inserts into the inbox collections to this worker's broker."""
+
+    def __init__(self, sources):
+        self.sources = sources
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stopped.clear()
+        for kind, collection in self.sources.items():
+            thread = threading.Thread(
+                target=self._watch,
+                args=(kind, collection),
+                name=f"{kind}-change-stream",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _watch(self, kind, collection):
+        resume_token = None
+        while not self._stopped.is_set():
+            try:
+                with collection.watch(
+                    [{"$match": {"operationType": "insert"}}],
+                    resume_after=resume_token,
+                    max_await_time_ms=1000,
+                ) as stream:
+                    while not self._stopped.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        doc = change["fullDocument"]
+                        event_broker.publish(
+                            str(doc["pharmacy_id"]), inbox_event(kind, doc)
+                        )
+            except PyMongoError:
+                logger.exception("Inbox change stream for %s failed", kind)
+                self._stopped.wait(5)
+
+
+inbox_fanout = ChangeStreamFanout(
+    {"message": messages_collection, "prescription": prescriptions_collection}
+)
@@ -0,0 +1,135 @@
+from collections import Counter
+from math import ceil
+
+# Trigrams looked up per fuzzy lookup, rarest first
+PROBE_GRAMS = 3
+# Trigrams in more names than this (" pa", "mg ") narrow nothing down
+STOP_GRAM_POSTINGS = 5000
+
+
+def trigrams(key):
+    # Pad so short names and word starts still produce trigrams
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, max_distance=None):
+    """Levenshtein distance, giving up once it exceeds max_distance."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """Inverted index from trigrams to the normalized names containing them.
+
+    Not thread-safe on its own; MedicineNameIndex guards it with its lock.
+    Posting sets are replaced, never changed in place, so one handed out
+    by postings_for() stays valid after the lock is released.
+    """
+
+    def __init__(self):
+        self._postings = {}
+
+    def rebuild(self, keys):
+        postings = {}
+        for key in keys:
+            for gram in trigrams(key):
+                postings.setdefault(gram, set()).add(key)
+        self._postings = postings
+
+    def add(self, key):
+        for gram in trigrams(key):
+            self._postings[gram] = self._postings.get(gram, frozenset()) | {key}
+
+    def discard(self, key):
+        for gram in trigrams(key):
+            keys = self._postings.get(gram)
+            if keys is not None and key in keys:
+                if len(keys) == 1:
+                    del self._postings[gram]
+                else:
+                    self._postings[gram] = keys - {key}
+
+    def search(self, key, limit=5, threshold=0.3, rescore=50):
+        """Return (key, score) pairs ranked by trigram and edit similarity."""
+        scored = candidates(key, self.postings_for(key), threshold, rescore)
+        return rank(key, scored, limit)
+
+    def postings_for(self, key):
+        """The postings of key's trigrams, safe to read without the lock."""
+        return {gram: self._postings.get(gram, frozenset()) for gram in trigrams(key)}
+
+
+def candidates(key, postings, threshold=0.3, rescore=50):
+    """The rescore names most similar to key by trigram Jaccard.
+
+    Work per lookup is bounded however large the catalog grows. Names
+    are drawn only from the PROBE_GRAMS rarest of key's trigrams; a
+    trigram shared by more than STOP_GRAM_POSTINGS names is only used to
+    intersect down to the names containing several of them.
+    """
+    query_grams = trigrams(key)
+    by_size = sorted(
+        (gram for gram in query_grams if postings[gram]),
+        key=lambda gram: len(postings[gram]),
+    )
+    rare = [gram for gram in by_size if len(postings[gram]) <= STOP_GRAM_POSTINGS]
+    common = by_size[len(rare) :]
+    pool = set()
+    for gram in rare[:PROBE_GRAMS]:
+        pool.update(postings[gram])
+    if common:
+        # Set intersections run in C; stop once few enough names are left.
+        # A trigram leaving no name at all is likely one the typo made.
+        shared = postings[common[0]]
+        for gram in common[1:]:
+            if len(shared) <= STOP_GRAM_POSTINGS:
+                break
+            shared = (shared & postings[gram]) or shared
+        if len(shared) <= STOP_GRAM_POSTINGS:
+            pool.update(shared)
+
+    # A name reaching the Jaccard threshold has between threshold and
+    # 1 / threshold times as many trigrams; padded names yield at most
+    # len + 1 distinct trigrams
+    shortest = ceil(threshold * len(query_grams)) - 1
+    longest = len(query_grams) / threshold - 1
+    pool = {name for name in pool if shortest <= len(name) <= longest}
+    overlaps = Counter()
+    for gram in query_grams:
+        overlaps.update(pool & postings[gram])
+
+    scored = []
+    for candidate, overlap in overlaps.items():
+        jaccard = overlap / (len(query_grams) + len(candidate) + 1 - overlap)
+        if jaccard >= threshold:
+            scored.append((jaccard, candidate))
+    scored.sort(reverse=True)
+    return scored[:rescore]
+
+
+def rank(key, scored, limit=5):
+    """Blend (jaccard, candidate) pairs with edit similarity to key."""
+    ranked = []
+    for jaccard, candidate in scored:
+        longest = max(len(key), len(candidate))
+        distance = edit_distance(key, candidate, max_distance=longest)
+        similarity = (jaccard + 1 - distance / longest) / 2
+        ranked.append((candidate, round(similarity, 4)))
+    ranked.sort(key=lambda pair: (-pair[1], pair[0]))
+    return ranked[:limit]
@@ -0,0 +1,93 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from bson import ObjectId
+from config import settings
+from db import user_history_collection
+from services.background import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryRecorder:
+    """Write-behind buffer for user search history.
+
+    Searches are queued in memory and written with insert_many once
+    batch_size entries are pending or every flush_interval seconds,
+    instead of one insert per search.
+    """
+
+    def __init__(self, batch_size, flush_interval, max_pending, per_user):
+        self.batch_size = batch_size
+        self.per_user = per_user
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._pending = deque(maxlen=max_pending)
+        self._task = PeriodicTask("history-flush", flush_interval, self.flush)
+
+    def record(self, user_id, query):
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(
+                {
+                    "user_id": ObjectId(user_id),
+                    "query": query,
+                    "searched_at": datetime.now(tz=timezone.utc),
+                }
+            )
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._task.wake()
+
+    def discard(self, user_id):
+        # Forget queued entries, e.g. when the user clears their history
+        user_id = ObjectId(user_id)
+        with self._lock:
+            kept = [entry for entry in self._pending if entry["user_id"] != user_id]
+            self._pending.clear()
+            self._pending.extend(kept)
+
+    def flush(self):
+        with self._lock:
+            entries = list(self._pending)
+            self._pending.clear()
+        if not entries:
+            return
+        for start in range(0, len(entries), self.batch_size):
+            user_history_collection.insert_many(
+                entries[start : start + self.batch_size], ordered=False
+            )
+        for user_id in {entry["user_id"] for entry in entries}:
+            self._trim(user_id)
+
+    def _trim(self, user_id):
+        # Keep only the newest per_user entries for this user
+        oldest_kept = list(
+            user_history_collection.find({"user_id": user_id}, {"searched_at": 1})
+            .sort("searched_at", -1)
+            .skip(self.per_user - 1)
+            .limit(1)
+        )
+        if oldest_kept:
+            user_history_collection.delete_many(
+                {
+                    "user_id": user_id,
+                    "searched_at": {"$lt": oldest_kept[0]["searched_at"]},
+                }
+            )
+
+    def start(self):
+        self._task.start()
+
+    def stop(self):
+        self._task.stop()
+
+
+history_recorder = HistoryRecorder(
+    batch_size=settings.history_batch_size,
+    flush_interval=settings.history_flush_seconds,
+    max_pending=settings.history_buffer_size,
+    per_user=settings.history_per_user,
+)
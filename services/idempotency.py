@@ -0,0 +1,205 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+from fastapi.params import Form
+from fastapi.security import HTTPBearer
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from db import idempotency_keys_collection
+from dependencies.authn import optional_user_id
+from services.cache import LocalVersionStore, ResultCache
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# A request still holding its key after this long is assumed dead
+IDEMPOTENCY_LEASE = timedelta(minutes=5)
+
+bearer = HTTPBearer(auto_error=False)
+# Completed responses only; in-progress keys always go to Mongo
+idempotency_cache = ResultCache(
+    max_entries=settings.idempotency_cache_size,
+    ttl_seconds=settings.idempotency_ttl_hours * 3600,
+    versions=LocalVersionStore(),
+)
+
+
+async def body_fingerprint(request: Request, is_form):
+    """Hash what the handler will read from the body.
+
+    Forms are hashed field by field, with files by content, because a
+    client rebuilding the same form for a retry picks a new multipart
+    boundary and the raw bytes differ.
+    """
+    digest = hashlib.sha256()
+    if not is_form:
+        digest.update(await request.body())
+        return digest.hexdigest()
+    # Parsed once here; FastAPI reuses it when it builds the arguments
+    form = await request.form()
+    for name, value in sorted(form.multi_items(), key=lambda item: item[0]):
+        digest.update(name.encode() + b"\0")
+        if isinstance(value, StarletteUploadFile):
+            content = hashlib.sha256()
+            while chunk := await value.read(64 * 1024):
+                content.update(chunk)
+            await value.seek(0)
+            digest.update(b"file:" + content.digest())
+        else:
+            digest.update(value.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def request_fingerprint(request: Request, body_digest):
+    digest = hashlib.sha256()
+    for part in (request.method, request.url.path, request.url.query):
+        digest.update(part.encode() + b"\0")
+    if body_digest is not None:
+        digest.update(body_digest.encode())
+    return digest.hexdigest()
+
+
+def claim_key(key_id, user_id, fingerprint):
+    """Take the key for this request, or return the record holding it."""
+    while True:
+        now = datetime.now(tz=timezone.utc)
+        try:
+            idempotency_keys_collection.insert_one(
+                {
+                    "_id": key_id,
+                    "user_id": user_id,
+                    "fingerprint": fingerprint,
+                    "status": "in_progress",
+                    "locked_until": now + IDEMPOTENCY_LEASE,
+                    "created_at": now,
+                }
+            )
+            return None
+        except DuplicateKeyError:
+            pass
+        # Take over a key whose request died before finishing
+        taken = idempotency_keys_collection.find_one_and_update(
+            {
+                "_id": key_id,
+                "fingerprint": fingerprint,
+                "status": "in_progress",
+                "locked_until": {"$lt": now},
+            },
+            {"$set": {"locked_until": now + IDEMPOTENCY_LEASE}},
+        )
+        if taken:
+            return None
+        record = idempotency_keys_collection.find_one({"_id": key_id})
+        # Otherwise the holder failed and released it meanwhile: try again
+        if record is not None:
+            return record
+
+
+def save_response(key_id, response: Response):
+    stored = {
+        "status_code": response.status_code,
+        "headers": [
+            [name.decode("latin-1"), value.decode("latin-1")]
+            for name, value in response.raw_headers
+        ],
+        "body": response.body,
+    }
+    record = idempotency_keys_collection.find_one_and_update(
+        {"_id": key_id},
+        {"$set": {"status": "done", "response": stored}},
+        projection={"fingerprint": 1, "status": 1, "response": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if record:
+        idempotency_cache.put(key_id, 0, record)
+
+
+def release_key(key_id):
+    idempotency_keys_collection.delete_one({"_id": key_id, "status": "in_progress"})
+
+
+def replay(record, fingerprint):
+    if record["fingerprint"] != fingerprint:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            f"{IDEMPOTENCY_HEADER} was already used for a different request",
+        )
+    if record["status"] != "done":
+        raise HTTPException(
+            status.HTTP_409_CONFLICT,
+            f"A request with this {IDEMPOTENCY_HEADER} is still in progress",
+        )
+    stored = record["response"]
+    response = Response(content=stored["body"], status_code=stored["status_code"])
+    response.raw_headers = [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in stored["headers"]
+    ] + [(REPLAYED_HEADER.lower().encode("latin-1"), b"true")]
+    return response
+
+
+class IdempotentRoute(APIRoute):
+    """Route class replaying POST responses for a repeated Idempotency-Key.
+
+    The first request with a key claims it in the TTL-indexed
+    idempotency_keys collection and its response is stored there once it
+    completes; a retry with the same key and request gets that response
+    back without running the handler again. Keys are scoped per user and
+    per endpoint. Routes that parse their own body, like streamed uploads,
+    are fingerprinted without reading it.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        if "POST" not in self.methods:
+            return handler
+        reads_body = self.body_field is not None
+        is_form = reads_body and isinstance(self.body_field.field_info, Form)
+
+        async def idempotent_handler(request: Request) -> Response:
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None:
+                return await handler(request)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                raise HTTPException(
+                    status.HTTP_400_BAD_REQUEST,
+                    f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters",
+                )
+            user_id = optional_user_id(await bearer(request))
+            if user_id is None:
+                # Let the handler's own authentication reject the request
+                return await handler(request)
+            key_id = hashlib.sha256(
+                f"{user_id}\0{self.path}\0{key}".encode()
+            ).hexdigest()
+            body_digest = None
+            if reads_body:
+                body_digest = await body_fingerprint(request, is_form)
+            fingerprint = request_fingerprint(request, body_digest)
+
+            record = idempotency_cache.get(key_id, 0)
+            if record is None:
+                record = await run_in_threadpool(
+                    claim_key, key_id, user_id, fingerprint
+                )
+            if record is not None:
+                return replay(record, fingerprint)
+
+            try:
+                response = await handler(request)
+            except BaseException:
+                # Nothing to replay; a retry runs the handler again
+                await run_in_threadpool(release_key, key_id)
+                raise
+            if response.status_code >= 500 or not hasattr(response, "body"):
+                await run_in_threadpool(release_key, key_id)
+            else:
+                await run_in_threadpool(save_response, key_id, response)
+            return response
+
+        return idempotent_handler
@@ -0,0 +1,92 @@
+from collections import Counter
+from datetime import datetime
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pydantic import BaseModel, Field
+from db import inbox_counters_collection, messages_collection, prescriptions_collection
+
+# Per-pharmacy unread counters, keyed by pharmacy _id. Each kind maps to
+# its counter field, source collection and timestamp field.
+INBOX_KINDS = {
+    "messages": ("unread_messages", messages_collection, "sent_at"),
+    "prescriptions": ("unread_prescriptions", prescriptions_collection, "uploaded_at"),
+}
+
+
+class BulkReadRequest(BaseModel):
+    ids: list[str] = Field(default_factory=list, max_length=500)
+    before: datetime | None = None
+
+
+def count_unread(pharmacy_id):
+    return {
+        counter: collection.count_documents(
+            {"pharmacy_id": pharmacy_id, "is_read": False}
+        )
+        for counter, collection, _ in INBOX_KINDS.values()
+    }
+
+
+def seed_unread(pharmacy_id, counts=None):
+    """Create a pharmacy's counters unless they exist; never overwrites them.
+
+    A new pharmacy is seeded with zeros. Counters written concurrently by
+    bump_unread always win over a seed, so a stale count can't replace them.
+    """
+    counts = counts or {counter: 0 for counter, _, _ in INBOX_KINDS.values()}
+    inbox_counters_collection.update_one(
+        {"_id": pharmacy_id}, {"$setOnInsert": counts}, upsert=True
+    )
+
+
+def bump_unread(pharmacy_id, kind, delta):
+    if not delta:
+        return
+    counter = INBOX_KINDS[kind][0]
+    # No upsert: a pharmacy without counters is seeded from the source
+    # collections on first read, and those already include this change
+    inbox_counters_collection.update_one(
+        {"_id": pharmacy_id}, {"$inc": {counter: delta}}
+    )
+
+
+def drop_unread(kind, deleted):
+    """Take deleted unread items off their pharmacies' counters."""
+    counter = INBOX_KINDS[kind][0]
+    unread = Counter(doc["pharmacy_id"] for doc in deleted if not doc.get("is_read"))
+    # No upsert: a pharmacy without counters is seeded correctly on first read
+    for pharmacy_id, count in unread.items():
+        inbox_counters_collection.update_one(
+            {"_id": pharmacy_id}, {"$inc": {counter: -count}}
+        )
+
+
+def get_unread_counts(pharmacy_id):
+    counts = inbox_counters_collection.find_one({"_id": pharmacy_id})
+    if counts is None:
+        # Only pharmacies registered before counters existed get here
+        seed_unread(pharmacy_id, count_unread(pharmacy_id))
+        counts = inbox_counters_collection.find_one({"_id": pharmacy_id})
+    return {
+        kind: max(counts.get(counter, 0), 0)
+        for kind, (counter, _, _) in INBOX_KINDS.items()
+    }
+
+
+def mark_read_in_bulk(pharmacy_id, kind, request: BulkReadRequest):
+    """Mark many items read with one update_many and adjust the counter."""
+    if not request.ids and request.before is None:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, "Provide ids, a before timestamp, or both"
+        )
+    _, collection, timestamp_field = INBOX_KINDS[kind]
+    read_filter = {"pharmacy_id": pharmacy_id, "is_read": False}
+    if request.ids:
+        if not all(ObjectId.is_valid(item_id) for item_id in request.ids):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid ID format")
+        read_filter["_id"] = {"$in": [ObjectId(item_id) for item_id in request.ids]}
+    if request.before is not None:
+        read_filter[timestamp_field] = {"$lte": request.before}
+    result = collection.update_many(read_filter, {"$set": {"is_read": True}})
+    bump_unread(pharmacy_id, kind, -result.modified_count)
+    return result.modified_count
@@ -0,0 +1,183 @@
+import logging
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+from config import settings
+from db import med_inventory_collection, messages_collection, pharmacies_collection
+from services.background import PeriodicTask
+from services.events import publish_inbox_event
+from services.inbox import bump_unread
+
+logger = logging.getLogger(__name__)
+
+# Items still waiting for an alert; matches the partial index's filter
+PENDING_ALERT = {"low_stock": True, "low_stock_notified": False}
+SYSTEM_SENDER = "MediFind"
+
+
+def low_stock_threshold(pharmacy_doc):
+    return pharmacy_doc.get("low_stock_threshold", settings.low_stock_threshold)
+
+
+def low_stock_fields(quantity, threshold):
+    # Written with every quantity change; a restocked item is re-armed so
+    # it raises a new alert the next time it runs low
+    if quantity <= threshold:
+        return {"low_stock": True}
+    return {"low_stock": False, "low_stock_notified": False}
+
+
+def apply_low_stock_threshold(pharmacy_id, threshold):
+    # Re-flag one pharmacy's stock after its threshold changed
+    med_inventory_collection.update_many(
+        {"pharmacy_id": pharmacy_id, "quantity": {"$lte": threshold}},
+        {"$set": {"low_stock": True}},
+    )
+    med_inventory_collection.update_many(
+        {"pharmacy_id": pharmacy_id, "quantity": {"$gt": threshold}},
+        {"$set": {"low_stock": False, "low_stock_notified": False}},
+    )
+
+
+def backfill_low_stock():
+    # Flag items stocked before low-stock alerts existed
+    unflagged = {"low_stock": {"$exists": False}}
+    pharmacy_ids = med_inventory_collection.distinct("pharmacy_id", unflagged)
+    if not pharmacy_ids:
+        return
+    thresholds = {
+        pharmacy["_id"]: low_stock_threshold(pharmacy)
+        for pharmacy in pharmacies_collection.find(
+            {"_id": {"$in": pharmacy_ids}}, {"low_stock_threshold": 1}
+        )
+    }
+    for pharmacy_id in pharmacy_ids:
+        threshold = thresholds.get(pharmacy_id, settings.low_stock_threshold)
+        for low, quantity in ((True, {"$lte": threshold}), (False, {"$gt": threshold})):
+            med_inventory_collection.update_many(
+                {**unflagged, "pharmacy_id": pharmacy_id, "quantity": quantity},
+                {"$set": {"low_stock": low, "low_stock_notified": False}},
+            )
+    # Items without a usable quantity are never low
+    med_inventory_collection.update_many(
+        unflagged, {"$set": {"low_stock": False, "low_stock_notified": False}}
+    )
+
+
+def alert_message(pharmacy_id, items, now):
+    lines = [f"- {item['medicine_name']}: {item['quantity']} left" for item in items]
+    count = len(items)
+    return {
+        "user_id": None,
+        "sender": "system",
+        "kind": "low_stock",
+        "pharmacy_id": pharmacy_id,
+        "subject": f"Low stock: {count} item{'s' if count != 1 else ''}",
+        "message": "These items are running low:\n" + "\n".join(lines),
+        "items": [
+            {
+                "medicine_id": item["_id"],
+                "medicine_name": item["medicine_name"],
+                "quantity": item["quantity"],
+            }
+            for item in items
+        ],
+        "sent_at": now,
+        "is_read": False,
+    }
+
+
+class LowStockAlerts:
+    """Delivers low-stock alerts into pharmacy inboxes.
+
+    Every scan_interval seconds one query on a partial index gathers up to
+    batch_size items that ran low since the last scan. They are claimed,
+    grouped into one inbox message per pharmacy and written with a single
+    insert_many.
+    """
+
+    def __init__(self, scan_interval, batch_size):
+        self.batch_size = batch_size
+        self._task = PeriodicTask("low-stock-scan", scan_interval, self.scan)
+
+    def scan(self):
+        pending = list(
+            med_inventory_collection.find(
+                PENDING_ALERT, {"pharmacy_id": 1, "medicine_name": 1, "quantity": 1}
+            )
+            .sort("updated_at", 1)
+            .limit(self.batch_size)
+        )
+        if not pending:
+            return
+        items = self._claim(pending)
+        if items:
+            self._deliver(items)
+        # A full batch means more may be waiting
+        if len(pending) == self.batch_size:
+            self._task.wake()
+
+    def _claim(self, pending):
+        # Other workers scan too; only items this scan flipped are its own.
+        # A string, as inventory documents are returned to clients as-is.
+        claim = str(ObjectId())
+        ids = [item["_id"] for item in pending]
+        result = med_inventory_collection.update_many(
+            {**PENDING_ALERT, "_id": {"$in": ids}},
+            {"$set": {"low_stock_notified": True, "low_stock_claim": claim}},
+        )
+        if result.modified_count == len(ids):
+            return pending
+        claimed = {
+            doc["_id"]
+            for doc in med_inventory_collection.find(
+                {"_id": {"$in": ids}, "low_stock_claim": claim}, {"_id": 1}
+            )
+        }
+        return [item for item in pending if item["_id"] in claimed]
+
+    def _deliver(self, items):
+        by_pharmacy = {}
+        for item in items:
+            by_pharmacy.setdefault(item["pharmacy_id"], []).append(item)
+        now = datetime.now(tz=timezone.utc)
+        messages = [
+            alert_message(pharmacy_id, pharmacy_items, now)
+            for pharmacy_id, pharmacy_items in by_pharmacy.items()
+        ]
+        ids = [item["_id"] for item in items]
+        try:
+            messages_collection.insert_many(messages, ordered=False)
+        except PyMongoError:
+            # Hand the items back to the next scan rather than drop them
+            med_inventory_collection.update_many(
+                {"_id": {"$in": ids}, "low_stock": True},
+                {
+                    "$set": {"low_stock_notified": False},
+                    "$unset": {"low_stock_claim": ""},
+                },
+            )
+            raise
+        med_inventory_collection.update_many(
+            {"_id": {"$in": ids}}, {"$unset": {"low_stock_claim": ""}}
+        )
+        for message in messages:
+            bump_unread(message["pharmacy_id"], "messages", 1)
+            publish_inbox_event("message", message)
+        logger.info(
+            "Sent low-stock alerts for %d items to %d pharmacies",
+            len(items),
+            len(messages),
+        )
+
+    def start(self):
+        self._task.start()
+
+    def stop(self):
+        self._task.stop()
+
+
+low_stock_alerts = LowStockAlerts(
+    scan_interval=settings.low_stock_scan_seconds,
+    batch_size=settings.low_stock_batch_size,
+)
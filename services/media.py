@@ -0,0 +1,73 @@
+import hashlib
+from datetime import datetime, timezone
+from io import BytesIO
+import cloudinary.uploader
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config import settings
+from db import media_collection
+
+
+def preprocess_image(data: bytes) -> bytes:
+    """Downscale and recompress an image before it is uploaded."""
+    bounds = (settings.image_max_dimension, settings.image_max_dimension)
+    with Image.open(BytesIO(data)) as image:
+        original_size = image.size
+        # Let the JPEG decoder skip detail we are about to throw away
+        image.draft("RGB", bounds)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(bounds)
+        output = BytesIO()
+        if image.mode in ("RGBA", "LA", "P") and (
+            image.mode != "P" or "transparency" in image.info
+        ):
+            image.save(output, "PNG", optimize=True)
+        else:
+            image.convert("RGB").save(
+                output,
+                "JPEG",
+                quality=settings.image_quality,
+                optimize=True,
+                progressive=True,
+            )
+    processed = output.getvalue()
+    # Small, already-compressed images can grow when re-encoded
+    if len(processed) >= len(data) and image.size == original_size:
+        return data
+    return processed
+
+
+def upload_image(upload: UploadFile) -> str:
+    """Upload an image once and return its Cloudinary secure_url.
+
+    Files are keyed by the SHA-256 of their original bytes, so sending the
+    same file again reuses the stored URL without processing or uploading.
+    """
+    data = upload.file.read(settings.max_image_bytes + 1)
+    if len(data) > settings.max_image_bytes:
+        raise HTTPException(
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Image file is too large"
+        )
+    digest = hashlib.sha256(data).hexdigest()
+    existing = media_collection.find_one({"_id": digest}, {"secure_url": 1})
+    if existing:
+        return existing["secure_url"]
+
+    try:
+        processed = preprocess_image(data)
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid image file")
+    upload_result = cloudinary.uploader.upload(processed, resource_type="image")
+    media_collection.update_one(
+        {"_id": digest},
+        {
+            "$setOnInsert": {
+                "secure_url": upload_result["secure_url"],
+                "bytes": len(processed),
+                "original_bytes": len(data),
+                "created_at": datetime.now(tz=timezone.utc),
+            }
+        },
+        upsert=True,
+    )
+    return upload_result["secure_url"]
@@ -0,0 +1,76 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+from db import drop_replaced_indexes, migrations_collection
+from services.low_stock import backfill_low_stock
+from services.projections import (
+    backfill_name_keys,
+    backfill_name_tokens,
+    backfill_pharmacy_locations,
+    backfill_pharmacy_summaries,
+)
+
+logger = logging.getLogger(__name__)
+
+# How long a worker owns a running migration before another may take it over
+MIGRATION_LEASE = timedelta(minutes=10)
+
+# One-off backfills for documents written before a field existed, in
+# order. Their $exists: false filters cannot use an index, so each runs
+# once per database rather than on every worker's startup.
+MIGRATIONS = [
+    ("pharmacy_summaries", backfill_pharmacy_summaries),
+    ("pharmacy_locations", backfill_pharmacy_locations),
+    ("name_keys", backfill_name_keys),
+    ("low_stock_flags", backfill_low_stock),
+    ("name_tokens", backfill_name_tokens),
+    ("drop_replaced_indexes", drop_replaced_indexes),
+]
+
+
+def _claim(name):
+    now = datetime.now(tz=timezone.utc)
+    try:
+        migrations_collection.insert_one(
+            {"_id": name, "status": "running", "lease_until": now + MIGRATION_LEASE}
+        )
+        return True
+    except DuplicateKeyError:
+        pass
+    # Take over one whose worker died, or that failed last time
+    return (
+        migrations_collection.find_one_and_update(
+            {
+                "_id": name,
+                "status": {"$in": ["running", "failed"]},
+                "lease_until": {"$lte": now},
+            },
+            {"$set": {"status": "running", "lease_until": now + MIGRATION_LEASE}},
+        )
+        is not None
+    )
+
+
+def run_migrations():
+    # One small marker document per migration, so this read stays cheap
+    done = {
+        doc["_id"]
+        for doc in migrations_collection.find({}, {"status": 1})
+        if doc["status"] == "done"
+    }
+    for name, migrate in MIGRATIONS:
+        if name in done or not _claim(name):
+            continue
+        try:
+            migrate()
+        except Exception:
+            logger.exception("Migration %s failed", name)
+            now = datetime.now(tz=timezone.utc)
+            migrations_collection.update_one(
+                {"_id": name}, {"$set": {"status": "failed", "lease_until": now}}
+            )
+            raise
+        now = datetime.now(tz=timezone.utc)
+        migrations_collection.update_one(
+            {"_id": name}, {"$set": {"status": "done", "finished_at": now}}
+        )
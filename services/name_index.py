@@ -0,0 +1,234 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from config import settings
+from db import inventory_tombstones_collection, med_inventory_collection
+from services.background import PeriodicTask
+from services.fuzzy import TrigramIndex, candidates, rank
+from services.sync import SETTLE_TIME
+from utils import normalize_name
+
+# Names recounted per aggregation when catching up with other workers
+COUNT_BATCH = 1000
+
+
+class MedicineNameIndex:
+    """Sorted, in-process index of distinct normalized medicine names.
+
+    Each entry tracks how many inventory documents carry the name, how
+    many of them are in stock and the total quantity in stock. A trigram
+    index over the same names serves typo-tolerant lookups.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._entries = {}
+        self._trigrams = TrigramIndex()
+
+    def rebuild(self, docs):
+        keys = []
+        entries = {}
+        for doc in docs:
+            self._apply(keys, entries, doc.get("medicine_name"), doc.get("quantity"), 1)
+        keys.sort()
+        trigram_index = TrigramIndex()
+        trigram_index.rebuild(keys)
+        with self._lock:
+            self._keys = keys
+            self._entries = entries
+            self._trigrams = trigram_index
+
+    def add(self, name, quantity):
+        with self._lock:
+            self._update(name, quantity, 1)
+
+    def remove(self, name, quantity):
+        with self._lock:
+            self._update(name, quantity, -1)
+
+    def refresh(self, keys, entries):
+        """Replace the entries for keys with freshly counted ones."""
+        with self._lock:
+            for key in keys:
+                entry = entries.get(key)
+                existed = key in self._entries
+                if entry is not None:
+                    self._entries[key] = entry
+                    if not existed:
+                        insort(self._keys, key)
+                        self._trigrams.add(key)
+                elif existed:
+                    del self._entries[key]
+                    self._keys.pop(bisect_left(self._keys, key))
+                    self._trigrams.discard(key)
+
+    def fuzzy(self, query, limit=5):
+        """Closest known names to a possibly misspelled query."""
+        key = normalize_name(query)
+        # Only fetching the postings needs the lock; counting and scoring,
+        # the slow part, run without holding up writers or suggest()
+        with self._lock:
+            postings = self._trigrams.postings_for(key)
+        ranked = rank(key, candidates(key, postings), limit)
+        with self._lock:
+            # A name may have left the index meanwhile
+            return [
+                {"name": self._entries[candidate]["name"], "score": score}
+                for candidate, score in ranked
+                if candidate in self._entries
+            ]
+
+    def suggest(self, prefix, limit=10):
+        prefix = normalize_name(prefix)
+        suggestions = []
+        with self._lock:
+            position = bisect_left(self._keys, prefix)
+            while position < len(self._keys) and len(suggestions) < limit:
+                key = self._keys[position]
+                if not key.startswith(prefix):
+                    break
+                entry = self._entries[key]
+                suggestions.append(
+                    {
+                        "name": entry["name"],
+                        "stock": entry["stock"],
+                        "pharmacies": entry["in_stock"],
+                    }
+                )
+                position += 1
+        return suggestions
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _update(self, name, quantity, sign):
+        # Keep the trigram index in step with names appearing or vanishing
+        key = normalize_name(name or "")
+        existed = key in self._entries
+        self._apply(self._keys, self._entries, name, quantity, sign, keep_sorted=True)
+        exists = key in self._entries
+        if exists and not existed:
+            self._trigrams.add(key)
+        elif existed and not exists:
+            self._trigrams.discard(key)
+
+    @staticmethod
+    def _apply(keys, entries, name, quantity, sign, keep_sorted=False):
+        if not name:
+            return
+        key = normalize_name(name)
+        quantity = max(quantity or 0, 0)
+        entry = entries.get(key)
+        if entry is None:
+            if sign < 0:
+                return
+            entry = {"name": name, "listings": 0, "in_stock": 0, "stock": 0}
+            entries[key] = entry
+            if keep_sorted:
+                insort(keys, key)
+            else:
+                keys.append(key)
+        entry["listings"] += sign
+        entry["in_stock"] += sign if quantity > 0 else 0
+        entry["stock"] += sign * quantity
+        if entry["listings"] <= 0:
+            del entries[key]
+            if keep_sorted:
+                keys.pop(bisect_left(keys, key))
+
+
+medicine_names = MedicineNameIndex()
+
+
+def count_names(keys):
+    """Fresh index entries for keys, counted from the inventory."""
+    keys = list(keys)
+    entries = {}
+    for start in range(0, len(keys), COUNT_BATCH):
+        pipeline = [
+            {"$match": {"name_key": {"$in": keys[start : start + COUNT_BATCH]}}},
+            {
+                "$group": {
+                    "_id": "$name_key",
+                    "name": {"$first": "$medicine_name"},
+                    "listings": {"$sum": 1},
+                    "in_stock": {"$sum": {"$cond": [{"$gt": ["$quantity", 0]}, 1, 0]}},
+                    "stock": {"$sum": {"$max": ["$quantity", 0]}},
+                }
+            },
+        ]
+        for group in med_inventory_collection.aggregate(pipeline):
+            entries[group.pop("_id")] = group
+    return entries
+
+
+class NameIndexSync:
+    """Keeps this worker's name index in step with every worker's writes.
+
+    The index is built once in the background, then only the names that
+    changed are recounted: those of items in the (updated_at, _id) log,
+    the names renamed items left and those in deletion tombstones. A full
+    rebuild every rebuild_interval seconds repairs anything missed.
+    """
+
+    def __init__(self, index, poll_interval, rebuild_interval):
+        self.index = index
+        self.rebuild_interval = rebuild_interval
+        self._built_at = None
+        self._synced_until = None
+        self._task = PeriodicTask(
+            "name-index-sync", poll_interval, self.sync, run_on_stop=False
+        )
+
+    def sync(self):
+        if (
+            self._built_at is None
+            or time.monotonic() - self._built_at >= self.rebuild_interval
+        ):
+            self.rebuild()
+        else:
+            self.catch_up()
+
+    def rebuild(self):
+        started = datetime.now(tz=timezone.utc)
+        self.index.rebuild(
+            med_inventory_collection.find({}, {"medicine_name": 1, "quantity": 1})
+        )
+        self._built_at = time.monotonic()
+        self._synced_until = started
+
+    def catch_up(self):
+        until = datetime.now(tz=timezone.utc)
+        # The settle window is read again each time; recounting a name
+        # twice is harmless
+        since = self._synced_until - SETTLE_TIME
+        keys = set()
+        for doc in med_inventory_collection.find(
+            {"updated_at": {"$gt": since}}, {"name_key": 1, "renamed_from": 1}
+        ):
+            keys.update((doc.get("name_key"), doc.get("renamed_from")))
+        for tombstone in inventory_tombstones_collection.find(
+            {"deleted_at": {"$gt": since}}, {"name_key": 1}
+        ):
+            keys.add(tombstone.get("name_key"))
+        keys.discard(None)
+        if keys:
+            self.index.refresh(keys, count_names(keys))
+        self._synced_until = until
+
+    def start(self):
+        self._task.start()
+        # Build straight away rather than after the first interval
+        self._task.wake()
+
+    def stop(self):
+        self._task.stop()
+
+
+name_index_sync = NameIndexSync(
+    medicine_names,
+    poll_interval=settings.name_index_sync_seconds,
+    rebuild_interval=settings.name_index_rebuild_hours * 3600,
+)
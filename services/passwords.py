@@ -0,0 +1,71 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import bcrypt
+from fastapi import HTTPException, status
+from config import settings
+
+# Dedicated pool for bcrypt so a burst of logins cannot starve the
+# threadpool that serves every other endpoint
+_executor: Executor | None = None
+_pending = 0
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+def start_hash_pool():
+    global _executor
+    if _executor is not None:
+        return
+    if settings.hash_executor == "process":
+        _executor = ProcessPoolExecutor(max_workers=settings.hash_workers)
+    else:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.hash_workers, thread_name_prefix="bcrypt"
+        )
+
+
+def shutdown_hash_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def _run(fn, *args):
+    global _pending
+    # Reject instead of queueing without bound once the pool is saturated
+    if _pending >= settings.hash_max_pending:
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Server is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    start_hash_pool()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    hashed = await _run(_hash, password.encode(), settings.bcrypt_rounds)
+    return hashed.decode()
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run(_check, password.encode(), hashed.encode())
+
+
+def needs_rehash(hashed: str) -> bool:
+    # bcrypt hashes look like $2b$<cost>$<salt+digest>
+    try:
+        return int(hashed.split("$")[2]) != settings.bcrypt_rounds
+    except (IndexError, ValueError):
+        return True
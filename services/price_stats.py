@@ -0,0 +1,122 @@
+import threading
+from datetime import datetime, timezone
+from pymongo import DeleteOne, ReplaceOne
+from config import settings
+from db import med_inventory_collection, price_stats_collection
+from services.background import PeriodicTask
+from utils import normalize_name
+
+
+def median(sorted_values):
+    middle = len(sorted_values) // 2
+    if len(sorted_values) % 2:
+        return sorted_values[middle]
+    return (sorted_values[middle - 1] + sorted_values[middle]) / 2
+
+
+class PriceStats:
+    """Per-medicine price aggregates, refreshed only for changed names.
+
+    Inventory writes mark their normalized names dirty; every
+    flush_interval seconds the dirty names are recomputed from their
+    in-stock listings and written to the price_stats collection, which
+    /medicines/compare reads directly.
+    """
+
+    def __init__(self, flush_interval, offers):
+        self.offers = offers
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._task = PeriodicTask("price-stats-refresh", flush_interval, self.flush)
+
+    def mark_dirty(self, *names):
+        with self._lock:
+            self._dirty.update(normalize_name(name) for name in names if name)
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        now = datetime.now(tz=timezone.utc)
+        requests = []
+        for name_key in dirty:
+            stats = self._compute(name_key, now)
+            if stats is None:
+                requests.append(DeleteOne({"_id": name_key}))
+            else:
+                requests.append(ReplaceOne({"_id": name_key}, stats, upsert=True))
+            if len(requests) >= 500:
+                price_stats_collection.bulk_write(requests, ordered=False)
+                requests = []
+        if requests:
+            price_stats_collection.bulk_write(requests, ordered=False)
+
+    def _compute(self, name_key, now):
+        in_stock = {
+            "name_key": name_key,
+            "quantity": {"$gt": 0},
+            "pharmacy": {"$ne": None},
+        }
+        # Served by the (name_key, price) index, already in price order
+        prices = [
+            doc["price"]
+            for doc in med_inventory_collection.find(
+                in_stock, {"_id": 0, "price": 1}
+            ).sort("price", 1)
+        ]
+        if not prices:
+            return None
+        cheapest = list(
+            med_inventory_collection.find(
+                in_stock,
+                {
+                    "medicine_name": 1,
+                    "pharmacy_id": 1,
+                    "price": 1,
+                    "quantity": 1,
+                    "pharmacy": 1,
+                },
+            )
+            .sort([("price", 1), ("_id", 1)])
+            .limit(self.offers)
+        )
+        pharmacies = med_inventory_collection.distinct("pharmacy_id", in_stock)
+        return {
+            "name": cheapest[0]["medicine_name"],
+            "min_price": prices[0],
+            "median_price": median(prices),
+            "max_price": prices[-1],
+            "listings": len(prices),
+            "pharmacies_in_stock": len(pharmacies),
+            "offers": [
+                {
+                    "medicine_id": doc["_id"],
+                    "pharmacy_id": doc["pharmacy_id"],
+                    "price": doc["price"],
+                    "quantity": doc["quantity"],
+                    "pharmacy": doc["pharmacy"],
+                }
+                for doc in cheapest
+            ],
+            "refreshed_at": now,
+        }
+
+    def rebuild_if_empty(self):
+        # First start (or a wiped collection): queue every known name
+        if price_stats_collection.find_one({}, {"_id": 1}) is None:
+            self.mark_dirty(*med_inventory_collection.distinct("name_key"))
+            self._task.wake()
+
+    def start(self):
+        self._task.start()
+        self.rebuild_if_empty()
+
+    def stop(self):
+        self._task.stop()
+
+
+price_stats = PriceStats(
+    flush_interval=settings.price_stats_flush_seconds,
+    offers=settings.price_stats_offers,
+)
@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from db import med_inventory_collection, pharmacies_collection
+from services.cache import inventory_versions
+from services.price_stats import price_stats
+from utils import geo_point, name_tokens, normalize_name, pharmacy_summary
+
+
+# Inventory documents embed a summary of their pharmacy so search and
+# public reads need no join; these helpers keep that copy in sync.
+def sync_pharmacy_summary(pharmacy):
+    # updated_at moves too, so synced clients pick up the new details
+    med_inventory_collection.update_many(
+        {"pharmacy_id": pharmacy["_id"]},
+        {
+            "$set": {
+                "pharmacy": pharmacy_summary(pharmacy),
+                "updated_at": datetime.now(tz=timezone.utc),
+            }
+        },
+    )
+    inventory_versions.bump()
+    # Cheapest offers embed the summary too
+    price_stats.mark_dirty(
+        *med_inventory_collection.distinct("name_key", {"pharmacy_id": pharmacy["_id"]})
+    )
+
+
+def clear_pharmacy_summary(pharmacy_id):
+    # Hides a deleted pharmacy's items from every read path; the first
+    # step of its cascade job, which removes them afterwards
+    med_inventory_collection.update_many(
+        {"pharmacy_id": pharmacy_id}, {"$set": {"pharmacy": None}}
+    )
+    inventory_versions.bump()
+    price_stats.mark_dirty(
+        *med_inventory_collection.distinct("name_key", {"pharmacy_id": pharmacy_id})
+    )
+
+
+def backfill_pharmacy_summaries():
+    # Fill in items written before the summary (or its location) existed
+    stale = {"pharmacy.location": {"$exists": False}}
+    pharmacy_ids = med_inventory_collection.distinct("pharmacy_id", stale)
+    if not pharmacy_ids:
+        return
+    for pharmacy in pharmacies_collection.find({"_id": {"$in": pharmacy_ids}}):
+        med_inventory_collection.update_many(
+            {"pharmacy_id": pharmacy["_id"], **stale},
+            {"$set": {"pharmacy": pharmacy_summary(pharmacy)}},
+        )
+
+
+def backfill_pharmacy_locations(batch_size=1000):
+    # GeoJSON location for pharmacies registered before map queries existed
+    batch = []
+    for pharmacy in pharmacies_collection.find(
+        {"location": {"$exists": False}, "gps_location.lat": {"$ne": None}},
+        {"gps_location": 1},
+    ):
+        batch.append(
+            UpdateOne(
+                {"_id": pharmacy["_id"]},
+                {"$set": {"location": geo_point(pharmacy["gps_location"])}},
+            )
+        )
+        if len(batch) >= batch_size:
+            pharmacies_collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        pharmacies_collection.bulk_write(batch, ordered=False)
+
+
+def backfill_name_tokens(batch_size=1000):
+    # Fill in the words search matches on
+    batch = []
+    for doc in med_inventory_collection.find(
+        {"name_tokens": {"$exists": False}}, {"medicine_name": 1}
+    ):
+        batch.append(
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"name_tokens": name_tokens(doc.get("medicine_name", ""))}},
+            )
+        )
+        if len(batch) >= batch_size:
+            med_inventory_collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        med_inventory_collection.bulk_write(batch, ordered=False)
+
+
+def backfill_name_keys(batch_size=1000):
+    # Fill in the normalized name used by indexed search
+    batch = []
+    for doc in med_inventory_collection.find(
+        {"name_key": {"$exists": False}}, {"medicine_name": 1}
+    ):
+        batch.append(
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"name_key": normalize_name(doc.get("medicine_name", ""))}},
+            )
+        )
+        if len(batch) >= batch_size:
+            med_inventory_collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        med_inventory_collection.bulk_write(batch, ordered=False)
@@ -0,0 +1,69 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one execution.
+
+    The first caller for a key runs fn; callers arriving with the same key
+    while it is in flight wait for it and share its result or exception.
+    Nothing is kept once the call finishes, so this is not a cache.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        flight_groups[name] = self
+
+    def do(self, key, fn):
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                self.shared += 1
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as error:
+                call.error = error
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executed": self.calls - self.shared,
+                "shared": self.shared,
+                "coalescing_ratio": (
+                    round(self.shared / self.calls, 4) if self.calls else 0.0
+                ),
+                "in_flight": len(self._in_flight),
+            }
+
+
+# Every group by name, reported by /health
+flight_groups = {}
+
+
+def coalescing_stats():
+    return {name: group.stats() for name, group in flight_groups.items()}
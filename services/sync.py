@@ -0,0 +1,77 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from db import inventory_tombstones_collection
+
+DUPLICATE_KEY = 11000
+# Changes younger than this are left for the next read of the logs, so a
+# write that commits late with an earlier updated_at is not skipped over
+SETTLE_TIME = timedelta(seconds=5)
+
+
+def record_deletions(medicines):
+    """Leave a tombstone per inventory item about to be deleted.
+
+    Called before the delete, so a crash in between leaves at worst a
+    tombstone for an item that still exists rather than a deleted item
+    synced clients never hear about. Items already tombstoned by an
+    earlier attempt are skipped.
+    """
+    now = datetime.now(tz=timezone.utc)
+    tombstones = [
+        {
+            "_id": med["_id"],
+            "pharmacy_id": med.get("pharmacy_id"),
+            "name_key": med.get("name_key"),
+            "deleted_at": now,
+        }
+        for med in medicines
+    ]
+    if not tombstones:
+        return
+    try:
+        inventory_tombstones_collection.insert_many(tombstones, ordered=False)
+    except BulkWriteError as error:
+        if any(
+            write_error["code"] != DUPLICATE_KEY
+            for write_error in error.details.get("writeErrors", [])
+        ) or error.details.get("writeConcernErrors"):
+            raise
+
+
+def _millis(moment):
+    # Mongo hands back naive UTC datetimes
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _moment(millis):
+    return datetime.fromtimestamp(millis / 1000, tz=timezone.utc)
+
+
+def encode_sync_token(updated, deleted):
+    """Token for the next sync: the last (time, _id) seen in each log.
+
+    updated is None before the first item has been returned.
+    """
+    payload = {
+        "u": [_millis(updated[0]), str(updated[1])] if updated else None,
+        "d": [_millis(deleted[0]), str(deleted[1])],
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_sync_token(token):
+    # Raises ValueError when the token was not produced by encode_sync_token
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        updated = payload["u"]
+        if updated is not None:
+            updated = (_moment(updated[0]), ObjectId(updated[1]))
+        deleted = (_moment(payload["d"][0]), ObjectId(payload["d"][1]))
+        return updated, deleted
+    except Exception as error:
+        raise ValueError("Invalid sync token") from error
@@ -0,0 +1,105 @@
+import os
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from config import settings
+from db import trending_collection
+from services.background import PeriodicTask
+from utils import normalize_name
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitters sketch with a fixed number of counters.
+
+    When full, a new key replaces the smallest counter and inherits its
+    count as an overestimate, so frequent keys are never missed.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+
+    def offer(self, key, weight=1):
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight
+        else:
+            smallest = min(self.counts, key=self.counts.get)
+            self.counts[key] = self.counts.pop(smallest) + weight
+
+    def top(self, limit):
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+
+class TrendingTracker:
+    """Per-worker trending searches, merged across workers through Mongo.
+
+    Each worker counts searches in a SpaceSaving sketch and, every
+    flush_interval seconds, writes the window's counts as a snapshot and
+    starts a new window. The trending list served to clients is the sum
+    of all workers' snapshots within the trending window.
+    """
+
+    def __init__(self, capacity, flush_interval, window):
+        self.capacity = capacity
+        self.window = window
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._sketch = SpaceSaving(capacity)
+        self._trending = []
+        self._task = PeriodicTask("trending-flush", flush_interval, self.flush)
+
+    def record(self, query):
+        key = normalize_name(query)
+        if not key:
+            return
+        with self._lock:
+            self._sketch.offer(key)
+
+    def trending(self, limit=10):
+        return self._trending[:limit]
+
+    def flush(self):
+        with self._lock:
+            sketch = self._sketch
+            self._sketch = SpaceSaving(self.capacity)
+        now = datetime.now(tz=timezone.utc)
+        if sketch.counts:
+            trending_collection.insert_one(
+                {
+                    "worker": self.worker,
+                    "created_at": now,
+                    "items": [
+                        {"query": key, "count": count}
+                        for key, count in sketch.top(self.capacity)
+                    ],
+                }
+            )
+        self._refresh(now)
+
+    def _refresh(self, now):
+        merged = SpaceSaving(self.capacity)
+        for snapshot in trending_collection.find(
+            {"created_at": {"$gte": now - self.window}}, {"items": 1}
+        ):
+            for item in snapshot["items"]:
+                merged.offer(item["query"], item["count"])
+        self._trending = [
+            {"query": key, "count": count} for key, count in merged.top(self.capacity)
+        ]
+
+    def start(self):
+        self._refresh(datetime.now(tz=timezone.utc))
+        self._task.start()
+
+    def stop(self):
+        self._task.stop()
+
+
+trending_tracker = TrendingTracker(
+    capacity=settings.trending_capacity,
+    flush_interval=settings.trending_flush_seconds,
+    window=timedelta(minutes=settings.trending_window_minutes),
+)
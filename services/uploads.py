@@ -0,0 +1,163 @@
+from dataclasses import dataclass, field
+from tempfile import SpooledTemporaryFile
+from fastapi import HTTPException, Request, status
+from config import settings
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+# Leading bytes identifying the file types we accept
+MAGIC_SIGNATURES = {
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"%PDF-": "application/pdf",
+}
+SNIFF_BYTES = max(len(signature) for signature in MAGIC_SIGNATURES)
+MAX_FIELD_BYTES = 64 * 1024
+# Allowance for boundaries, part headers and small text fields
+FORM_OVERHEAD_BYTES = 256 * 1024
+
+
+def sniff_content_type(head):
+    for signature, content_type in MAGIC_SIGNATURES.items():
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+@dataclass
+class StreamedUpload:
+    fields: dict = field(default_factory=dict)
+    file: SpooledTemporaryFile | None = None
+    filename: str | None = None
+    content_type: str | None = None
+    size: int = 0
+
+
+async def read_streamed_upload(
+    request: Request, file_field, max_bytes, allowed_types, before_file=None
+):
+    """Parse a multipart body chunk by chunk into a spooled file.
+
+    The file part is sniffed from its first bytes and rejected as soon as
+    its type is not allowed or it grows past max_bytes, without waiting
+    for the rest of the body. before_file, if given, is awaited with the
+    fields received so far right before the file part's bytes are read.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, "Expected a multipart/form-data body"
+        )
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_bytes + FORM_OVERHEAD_BYTES:
+            raise HTTPException(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Uploaded file is too large"
+            )
+
+    events = []
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": lambda: events.append(("part_begin", b"")),
+            "on_part_data": lambda data, start, end: events.append(
+                ("part_data", data[start:end])
+            ),
+            "on_part_end": lambda: events.append(("part_end", b"")),
+            "on_header_field": lambda data, start, end: events.append(
+                ("header_field", data[start:end])
+            ),
+            "on_header_value": lambda data, start, end: events.append(
+                ("header_value", data[start:end])
+            ),
+            "on_header_end": lambda: events.append(("header_end", b"")),
+            "on_headers_finished": lambda: events.append(("headers_finished", b"")),
+        },
+    )
+    upload = StreamedUpload()
+    state = {"headers": {}, "field": b"", "value": b"", "name": None, "head": b""}
+
+    async def handle(event, data):
+        if event == "part_begin":
+            state.update(headers={}, field=b"", value=b"", name=None, head=b"")
+        elif event == "header_field":
+            state["field"] += data
+        elif event == "header_value":
+            state["value"] += data
+        elif event == "header_end":
+            state["headers"][state["field"].lower()] = state["value"]
+            state["field"] = state["value"] = b""
+        elif event == "headers_finished":
+            _, options = parse_options_header(
+                state["headers"].get(b"content-disposition")
+            )
+            state["name"] = options.get(b"name", b"").decode()
+            if state["name"] == file_field:
+                if upload.file is not None:
+                    raise HTTPException(
+                        status.HTTP_400_BAD_REQUEST, "Only one file can be uploaded"
+                    )
+                if before_file is not None:
+                    await before_file(upload.fields)
+                upload.filename = options.get(b"filename", b"").decode() or None
+                upload.file = SpooledTemporaryFile(max_size=settings.upload_spool_bytes)
+            else:
+                upload.fields[state["name"]] = b""
+        elif event == "part_data":
+            if state["name"] == file_field:
+                upload.size += len(data)
+                if upload.size > max_bytes:
+                    raise HTTPException(
+                        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        "Uploaded file is too large",
+                    )
+                if upload.content_type is None:
+                    state["head"] += data
+                    if len(state["head"]) >= SNIFF_BYTES:
+                        check_type()
+                upload.file.write(data)
+            else:
+                upload.fields[state["name"]] += data
+                if len(upload.fields[state["name"]]) > MAX_FIELD_BYTES:
+                    raise HTTPException(
+                        status.HTTP_400_BAD_REQUEST, "Form field is too large"
+                    )
+        elif event == "part_end":
+            if state["name"] == file_field:
+                if upload.content_type is None:
+                    check_type()
+            else:
+                upload.fields[state["name"]] = upload.fields[state["name"]].decode()
+
+    def check_type():
+        upload.content_type = sniff_content_type(state["head"])
+        if upload.content_type not in allowed_types:
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST,
+                "Invalid file type. Only JPG, PNG, or PDF are allowed.",
+            )
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event, data in events:
+                await handle(event, data)
+            events.clear()
+        parser.finalize()
+        for event, data in events:
+            await handle(event, data)
+    except BaseException:
+        if upload.file is not None:
+            upload.file.close()
+        raise
+
+    if upload.file is None:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY, f"Missing '{file_field}' upload"
+        )
+    upload.file.seek(0)
+    return upload
@@ -0,0 +1,118 @@
+import os
+import shutil
+import socket
+import subprocess
+import time
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+REPLICA_SET = "rs-test"
+MEMBERS = 3
+STARTUP_SECONDS = 60
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(check, what):
+    deadline = time.monotonic() + STARTUP_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except PyMongoError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+@pytest.fixture(scope="session")
+def replica_set(tmp_path_factory):
+    """Three local mongod processes in one replica set; yields its URI.
+
+    Test commands are enabled so a test can pause replication to the
+    secondary that serves reads. The app's settings point at the set, with
+    catalog reads sent to secondaries, before any app module is imported.
+    """
+    mongod = shutil.which("mongod")
+    if mongod is None:
+        pytest.skip("mongod is not on PATH")
+    ports = [_free_port() for _ in range(MEMBERS)]
+    processes = []
+    for port in ports:
+        path = tmp_path_factory.mktemp(f"mongod-{port}")
+        processes.append(
+            subprocess.Popen(
+                [
+                    mongod,
+                    "--replSet", REPLICA_SET,
+                    "--port", str(port),
+                    "--bind_ip", "127.0.0.1",
+                    "--dbpath", str(path),
+                    "--logpath", str(path / "mongod.log"),
+                    "--setParameter", "enableTestCommands=1",
+                ]
+            )
+        )
+    try:
+        seed = MongoClient(port=ports[0], directConnection=True)
+        _wait_for(lambda: seed.admin.command("ping"), "mongod to start")
+        for port in ports[1:]:
+            member = MongoClient(port=port, directConnection=True)
+            _wait_for(lambda: member.admin.command("ping"), "mongod to start")
+            member.close()
+        # The first member stays primary. The last is hidden: it still
+        # acknowledges majority writes, but secondary reads all go to the
+        # middle one, which a test can hold behind
+        members = [{"_id": 0, "host": f"127.0.0.1:{ports[0]}", "priority": 1}]
+        members += [
+            {"_id": index, "host": f"127.0.0.1:{port}", "priority": 0}
+            for index, port in enumerate(ports[1:], start=1)
+        ]
+        members[-1]["hidden"] = True
+        seed.admin.command(
+            "replSetInitiate", {"_id": REPLICA_SET, "members": members}
+        )
+
+        def ready():
+            states = [
+                member["stateStr"]
+                for member in seed.admin.command("replSetGetStatus")["members"]
+            ]
+            return states.count("PRIMARY") == 1 and states.count("SECONDARY") == 2
+
+        _wait_for(ready, "the replica set to elect a primary")
+        seed.close()
+
+        hosts = ",".join(f"127.0.0.1:{port}" for port in ports)
+        os.environ["MONGO_URI"] = f"mongodb://{hosts}/?replicaSet={REPLICA_SET}"
+        os.environ["MONGO_DB_NAME"] = "medifind_test"
+        os.environ["CATALOG_READ_PREFERENCE"] = "secondary"
+        yield {"uri": os.environ["MONGO_URI"], "ports": ports}
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+
+@pytest.fixture
+def pause_replication(replica_set):
+    """Stop the readable secondary fetching new writes; yields the resume call."""
+    secondary = MongoClient(port=replica_set["ports"][1], directConnection=True)
+
+    def set_paused(paused):
+        secondary.admin.command(
+            "configureFailPoint",
+            "stopReplProducer",
+            mode="alwaysOn" if paused else "off",
+        )
+
+    set_paused(True)
+    yield lambda: set_paused(False)
+    set_paused(False)
+    secondary.close()
@@ -0,0 +1,79 @@
+import threading
+import pytest
+from bson import ObjectId
+from starlette.responses import Response
+
+
+@pytest.fixture
+def consistency(replica_set):
+    # Imported once the replica set's settings are in the environment
+    from db import catalog_inventory_collection, med_inventory_collection
+    from services import consistency
+
+    med_inventory_collection.delete_many({})
+    return consistency, catalog_inventory_collection, med_inventory_collection
+
+
+def write_medicine(consistency, collection, user_id):
+    response = Response()
+    medicine = {"_id": ObjectId(), "pharmacy_id": user_id, "medicine_name": "Zinc"}
+    with consistency.writer_session(user_id, response) as session:
+        collection.insert_one(medicine, session=session)
+    return medicine["_id"], response.headers.get(consistency.CONSISTENCY_HEADER)
+
+
+def find_medicine(medicine_id):
+    def read(collection, session):
+        return collection.find_one({"_id": medicine_id}, session=session)
+
+    return read
+
+
+def test_lagging_secondary_misses_the_write(consistency, pause_replication):
+    consistency, catalog, inventory = consistency
+    medicine_id, _ = write_medicine(consistency, inventory, "owner-1")
+
+    assert catalog.find_one({"_id": medicine_id}) is None
+
+
+def test_token_waits_for_the_secondary(consistency, pause_replication):
+    consistency, _, inventory = consistency
+    medicine_id, token = write_medicine(consistency, inventory, "owner-2")
+    assert token
+
+    # The read blocks on the paused secondary until it has the write
+    resume = threading.Timer(1.0, pause_replication)
+    resume.start()
+    try:
+        found = consistency.read_your_writes(
+            "another-worker", token, find_medicine(medicine_id)
+        )
+    finally:
+        resume.join()
+    assert found is not None
+
+
+def test_remembered_token_is_used_without_a_header(consistency, pause_replication):
+    consistency, _, inventory = consistency
+    medicine_id, _ = write_medicine(consistency, inventory, "owner-3")
+
+    resume = threading.Timer(1.0, pause_replication)
+    resume.start()
+    try:
+        found = consistency.read_your_writes(
+            "owner-3", None, find_medicine(medicine_id)
+        )
+    finally:
+        resume.join()
+    assert found is not None
+
+
+def test_without_a_token_reads_the_primary(consistency, pause_replication):
+    consistency, _, inventory = consistency
+    medicine_id = ObjectId()
+    inventory.insert_one({"_id": medicine_id, "medicine_name": "Iron"})
+
+    found = consistency.read_your_writes(
+        "never-wrote", None, find_medicine(medicine_id)
+    )
+    assert found is not None
@@ -0,0 +1,105 @@
+"""Time typo-tolerant name lookups against a large synthetic catalog.
+
+Generates distinct medicine-like names, builds the same in-memory name
+index the app uses, then looks up misspelled copies of random names and
+reports build time, lookup latency percentiles and how often the
+intended name ranked first. Needs no database:
+
+    python -m tools.bench_fuzzy --names 1000000 --lookups 2000
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+from services.name_index import MedicineNameIndex
+from utils import normalize_name
+
+SYLLABLES = [
+    "am", "ox", "ci", "lin", "pa", "ra", "ce", "ta", "mol", "ibu", "pro",
+    "fen", "met", "for", "min", "lo", "ra", "ta", "dine", "clo", "pi", "dog",
+    "rel", "ator", "va", "sta", "tin", "zol", "pra", "sar", "tan", "cef",
+    "tri", "axo", "ne", "dox", "cyc", "lev", "flo", "xa", "cin", "gli",
+]
+STRENGTHS = ["50mg", "100mg", "250mg", "500mg", "1g", "5ml", "10ml", "20mg"]
+FORMS = ["tablets", "capsules", "syrup", "suspension", "cream", "injection"]
+
+
+def generate_names(count, rng):
+    names = set()
+    while len(names) < count:
+        stem = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        names.add(
+            f"{stem.capitalize()} {rng.choice(STRENGTHS)} {rng.choice(FORMS)}"
+        )
+    return list(names)
+
+
+def misspell(name, rng):
+    # One deletion, substitution or transposition, as users typically make
+    chars = list(name)
+    position = rng.randrange(len(chars) - 1)
+    edit = rng.choice(["delete", "substitute", "transpose"])
+    if edit == "delete":
+        del chars[position]
+    elif edit == "substitute":
+        chars[position] = rng.choice(string.ascii_lowercase)
+    else:
+        chars[position], chars[position + 1] = chars[position + 1], chars[position]
+    return "".join(chars)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    print(
+        f"{label}: "
+        f"p50 {percentile(timings, 0.5):.2f} ms, "
+        f"p95 {percentile(timings, 0.95):.2f} ms, "
+        f"p99 {percentile(timings, 0.99):.2f} ms, "
+        f"max {timings[-1]:.2f} ms"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--names", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    names = generate_names(args.names, rng)
+    print(f"generated {len(names)} names in {time.perf_counter() - started:.1f} s")
+
+    index = MedicineNameIndex()
+    started = time.perf_counter()
+    index.rebuild({"medicine_name": name, "quantity": 1} for name in names)
+    print(f"built index in {time.perf_counter() - started:.1f} s")
+
+    timings, copies = [], []
+    found = 0
+    for name in rng.sample(names, min(args.lookups, len(names))):
+        query = misspell(name, rng)
+        started = time.perf_counter()
+        matches = index.fuzzy(query)
+        timings.append((time.perf_counter() - started) * 1000)
+        if matches and normalize_name(matches[0]["name"]) == normalize_name(name):
+            found += 1
+        # The part of a lookup that holds the index lock
+        started = time.perf_counter()
+        index._trigrams.postings_for(normalize_name(query))
+        copies.append((time.perf_counter() - started) * 1000)
+    report(f"{len(timings)} lookups", timings)
+    report("lock held (postings fetch)", copies)
+    print(f"intended name ranked first for {found / len(timings):.1%} of lookups")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
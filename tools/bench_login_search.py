@@ -0,0 +1,134 @@
+"""Measure search latency while the API is busy with logins.
+
+Runs against a live server. Searches run alone first, as a baseline, and
+then again while other clients log in as fast as the hashing pool
+allows. The script reports search latency percentiles for both phases,
+login throughput and how many logins were turned away with 503. Run it
+once per HASH_EXECUTOR / HASH_WORKERS setting to compare them:
+
+    uvicorn main:app --workers 1 &
+    python -m tools.bench_login_search --url http://127.0.0.1:8000
+
+Set SEARCH_CACHE_SIZE=0 on the server so every search reaches Mongo.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+import httpx
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def report(label, timings):
+    if not timings:
+        print(f"{label}: no requests completed")
+        return
+    timings = sorted(timings)
+    print(
+        f"{label}: {len(timings)} requests, "
+        f"p50 {percentile(timings, 0.5):.1f} ms, "
+        f"p95 {percentile(timings, 0.95):.1f} ms, "
+        f"p99 {percentile(timings, 0.99):.1f} ms"
+    )
+
+
+async def ensure_user(client, email, password):
+    response = await client.post(
+        "/users/register",
+        data={
+            "email": email,
+            "password": password,
+            "username": "Load Test",
+            "phone": "0000000000",
+        },
+    )
+    # 409: registered by an earlier run
+    if response.status_code not in (200, 409):
+        raise SystemExit(f"Could not register {email}: {response.text}")
+
+
+async def search_loop(client, query, deadline, timings, statuses):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        response = await client.get("/search/medicine", params={"query": query})
+        timings.append((time.perf_counter() - started) * 1000)
+        statuses[response.status_code] += 1
+
+
+async def login_loop(client, email, password, deadline, timings, statuses):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        response = await client.post(
+            "/users/login", data={"email": email, "password": password}
+        )
+        statuses[response.status_code] += 1
+        if response.status_code == 200:
+            timings.append((time.perf_counter() - started) * 1000)
+        elif response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+
+async def run_phase(client, args, logins):
+    deadline = time.monotonic() + args.seconds
+    search_timings, login_timings = [], []
+    search_statuses, login_statuses = Counter(), Counter()
+    tasks = [
+        search_loop(client, args.query, deadline, search_timings, search_statuses)
+        for _ in range(args.searchers)
+    ]
+    if logins:
+        tasks += [
+            login_loop(
+                client, args.email, args.password, deadline,
+                login_timings, login_statuses,
+            )
+            for _ in range(args.logins)
+        ]
+    await asyncio.gather(*tasks)
+    return search_timings, search_statuses, login_timings, login_statuses
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.searchers + args.logins)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=60
+    ) as client:
+        await ensure_user(client, args.email, args.password)
+
+        searches, statuses, _, _ = await run_phase(client, args, logins=False)
+        report("search alone", searches)
+        print(f"  statuses {dict(statuses)}")
+
+        searches, statuses, logins, login_statuses = await run_phase(
+            client, args, logins=True
+        )
+        report("search during logins", searches)
+        print(f"  statuses {dict(statuses)}")
+        report("login", logins)
+        print(
+            f"  {len(logins) / args.seconds:.1f} logins/s, "
+            f"statuses {dict(login_statuses)}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--query", default="paracetamol")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--searchers", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--email", default="loadtest@example.com")
+    parser.add_argument("--password", default="load-test-password")
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Send bursts of identical public reads and count the database work.
+
+Each round fires --concurrency identical requests at once at a live
+server, for a search, one medicine and optionally one pharmacy's ads.
+The coalescing counters from /health show how many of those requests
+ran their queries and how many shared another request's result. With
+--mongo-uri the script also reports the server's own operation counters
+(queries, commands and getMores), which should grow with the number of
+executions rather than the number of requests:
+
+    SEARCH_CACHE_SIZE=0 uvicorn main:app &
+    python -m tools.load_coalescing --url http://127.0.0.1:8000 \\
+        --mongo-uri mongodb://localhost:27017
+
+Disable the search cache on the server, or repeated searches are served
+from it and never reach the coalescing layer. Operation counters are
+server-wide, so other traffic on the same mongod is counted too.
+"""
+
+import argparse
+import asyncio
+import sys
+import httpx
+from pymongo import MongoClient
+
+COUNTED_OPS = ("query", "command", "getmore")
+
+
+def database_ops(mongo):
+    counters = mongo.admin.command("serverStatus")["opcounters"]
+    return sum(counters[op] for op in COUNTED_OPS)
+
+
+async def coalescing(client):
+    response = await client.get("/health")
+    response.raise_for_status()
+    return response.json()["coalescing"]
+
+
+async def burst(client, path, params, concurrency):
+    responses = await asyncio.gather(
+        *(client.get(path, params=params) for _ in range(concurrency))
+    )
+    statuses = {response.status_code for response in responses}
+    if statuses != {200}:
+        raise SystemExit(f"{path} answered {sorted(statuses)}")
+
+
+async def find_medicine_id(client, query):
+    response = await client.get("/search/medicine", params={"query": query})
+    results = response.json().get("results", [])
+    if not results:
+        raise SystemExit(f"No medicine matches '{query}'; pass --medicine-id")
+    return results[0]["medicine_id"]
+
+
+async def run(args, mongo):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=60
+    ) as client:
+        medicine_id = args.medicine_id or await find_medicine_id(client, args.query)
+        # (flight group in /health, path, query parameters)
+        targets = [
+            ("search", "/search/medicine", {"query": args.query}),
+            ("medicine", f"/public/medicines/{medicine_id}", None),
+        ]
+        if args.pharmacy_id:
+            targets.append(
+                ("pharmacy_ads", f"/public/pharmacies/{args.pharmacy_id}/ads", None)
+            )
+
+        before = await coalescing(client)
+        ops_before = database_ops(mongo) if mongo else None
+        for _ in range(args.rounds):
+            for _, path, params in targets:
+                await burst(client, path, params, args.concurrency)
+        ops_after = database_ops(mongo) if mongo else None
+        after = await coalescing(client)
+
+    requests = args.rounds * args.concurrency
+    total_executed = 0
+    for group, _, _ in targets:
+        executed = after[group]["executed"] - before[group]["executed"]
+        shared = after[group]["shared"] - before[group]["shared"]
+        total_executed += executed
+        print(
+            f"{group}: {requests} requests, {executed} executed, "
+            f"{shared} shared ({shared / requests:.0%})"
+        )
+    print(
+        f"{requests * len(targets)} requests ran {total_executed} sets of queries"
+    )
+    if mongo:
+        # The two serverStatus calls are counted as well
+        print(f"mongod operations: {ops_after - ops_before - 1}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--mongo-uri")
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--query", default="paracetamol")
+    parser.add_argument("--medicine-id")
+    parser.add_argument("--pharmacy-id")
+    args = parser.parse_args(argv)
+    mongo = MongoClient(args.mongo_uri) if args.mongo_uri else None
+    try:
+        asyncio.run(run(args, mongo))
+    finally:
+        if mongo:
+            mongo.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
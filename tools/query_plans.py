@@ -0,0 +1,442 @@
+"""Check that the API's Mongo queries stay on indexes.
+
+Seeds a scratch database on a local mongod, builds the same indexes as
+the app and runs each route's query under explain("executionStats").
+A query fails when its plan contains a COLLSCAN, uses no index at all,
+sorts in memory where the index should give the order, or examines more
+documents or index keys than its bound allows per document it needs. A
+find needs only the documents it returns. An aggregation is bounded by
+the documents its $match selects instead, as search's $facet (and any
+$group) has to read every one of them to return its few output
+documents. The exit status is non-zero on any failure, so this can gate
+CI:
+
+    python -m tools.query_plans --uri mongodb://localhost:27017
+"""
+
+import argparse
+import os
+import random
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import MongoClient
+from db import ensure_indexes
+from routes.meds import build_stock_filter
+from routes.public import build_bounds_filter
+from routes.sync import build_log_filter
+from services.low_stock import PENDING_ALERT
+from routes.search import (
+    SearchSort,
+    build_basket_pipeline,
+    build_search_filter,
+    build_search_pipeline,
+)
+from utils import geo_point, name_tokens, normalize_name, pharmacy_summary
+
+# Also matches EXPRESS_IXSCAN, GEO_NEAR_2DSPHERE and friends
+INDEX_STAGES = ("IXSCAN", "COUNT_SCAN", "IDHACK", "GEO_NEAR")
+# Keys allowed beyond the bound: each $in value or seek past excluded
+# keys reads one key that is not a match
+KEY_SEEKS = 10
+MEDICINES = [
+    "Paracetamol",
+    "Ibuprofen",
+    "Amoxicillin",
+    "Metformin",
+    "Amlodipine",
+    "Omeprazole",
+    "Ciprofloxacin",
+    "Artemether Lumefantrine",
+    "Loratadine",
+    "Diclofenac",
+]
+STRENGTHS = ["100mg", "250mg", "500mg", "1g", "5ml", "10ml"]
+CATEGORIES = ["pain", "antibiotic", "diabetes", "heart", "allergy", "stomach"]
+
+
+@dataclass
+class Check:
+    collection: str
+    # The documents an aggregation legitimately needs, for the bounds
+    match: dict
+    command: dict
+    # Docs and keys examined per needed doc; None only asserts index use
+    max_ratio: float | None = 1.5
+    # Whether the results must come out of the index already in order
+    index_sort: bool = False
+    # Whether the needed docs are those returned rather than those matched
+    per_returned: bool = False
+
+
+def explain(database, command):
+    return database.command({"explain": command, "verbosity": "executionStats"})
+
+
+def walk(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from walk(value)
+
+
+def plan_stages(explanation):
+    return {node["stage"] for node in walk(explanation) if "stage" in node}
+
+
+def total(explanation, field):
+    # Aggregations report one executionStats per pushed-down $cursor
+    return sum(
+        node[field]
+        for node in walk(explanation)
+        if field in node and "executionStages" in node
+    )
+
+
+def facet_sorts(explanation):
+    # A $sort inside $facet's results never uses an index
+    return any(
+        "$sort" in stage
+        for node in walk(explanation)
+        for stage in node.get("$facet", {}).get("results", [])
+    )
+
+
+def evaluate(database, check):
+    explanation = explain(database, check.command)
+    stages = plan_stages(explanation)
+    examined = total(explanation, "totalDocsExamined")
+    keys = total(explanation, "totalKeysExamined")
+    if check.per_returned:
+        needed = total(explanation, "nReturned")
+    else:
+        needed = database[check.collection].count_documents(check.match)
+    problems = []
+    if "COLLSCAN" in stages:
+        problems.append("COLLSCAN")
+    elif not any(marker in stage for stage in stages for marker in INDEX_STAGES):
+        problems.append("no index used")
+    if check.index_sort and ("SORT" in stages or facet_sorts(explanation)):
+        problems.append("sorts in memory")
+    bound = check.max_ratio
+    if bound is not None:
+        if examined > bound * max(needed, 1):
+            problems.append(f"examined {examined} docs for {needed} needed")
+        # A whole-index scan still shows as IXSCAN; only this catches it
+        if keys > bound * max(needed, 1) + KEY_SEEKS:
+            problems.append(f"examined {keys} index keys for {needed} needed")
+    return problems, stages, examined, keys, needed
+
+
+def seed(database, rng):
+    now = datetime.now(tz=timezone.utc)
+    patients = [
+        {"_id": ObjectId(), "email": f"patient{i}@example.com", "role": "patient"}
+        for i in range(200)
+    ]
+    owners = [
+        {"_id": ObjectId(), "email": f"pharmacy{i}@example.com", "role": "pharmacy"}
+        for i in range(50)
+    ]
+    database["users"].insert_many(patients + owners)
+
+    pharmacies = []
+    for i, owner in enumerate(owners):
+        gps_location = {
+            "lat": 5.5 + rng.random() / 2,
+            "lon": -0.3 + rng.random() / 2,
+        }
+        pharmacies.append(
+            {
+                "_id": ObjectId(),
+                "user_id": owner["_id"],
+                "pharmacy_name": f"Pharmacy {i}",
+                "digital_address": f"GA-{i}",
+                "gps_location": gps_location,
+                "location": geo_point(gps_location),
+            }
+        )
+    database["pharmacies"].insert_many(pharmacies)
+
+    inventory = []
+    for pharmacy in pharmacies:
+        for medicine in MEDICINES:
+            for strength in rng.sample(STRENGTHS, 4):
+                name = f"{medicine} {strength}"
+                quantity = rng.choice([0] + list(range(1, 50)))
+                low_stock = quantity <= 5
+                inventory.append(
+                    {
+                        "pharmacy_id": pharmacy["_id"],
+                        "medicine_name": name,
+                        "name_key": normalize_name(name),
+                        "name_tokens": name_tokens(name),
+                        "price": round(rng.uniform(1, 300), 2),
+                        "quantity": quantity,
+                        "low_stock": low_stock,
+                        "low_stock_notified": low_stock and rng.random() < 0.9,
+                        "category": rng.choice(CATEGORIES),
+                        "pharmacy": pharmacy_summary(pharmacy),
+                        "updated_at": now - timedelta(minutes=rng.randrange(10000)),
+                    }
+                )
+    database["inventory"].insert_many(inventory)
+
+    messages, prescriptions, history, saved, carts = [], [], [], [], []
+    for patient in patients:
+        for _ in range(10):
+            pharmacy = rng.choice(pharmacies)
+            sent_at = now - timedelta(minutes=rng.randrange(10000))
+            messages.append(
+                {
+                    "user_id": patient["_id"],
+                    "pharmacy_id": pharmacy["_id"],
+                    "subject": "Stock",
+                    "message": "Do you have this?",
+                    "sent_at": sent_at,
+                    "is_read": rng.random() < 0.7,
+                }
+            )
+            prescriptions.append(
+                {
+                    "user_id": patient["_id"],
+                    "pharmacy_id": pharmacy["_id"],
+                    "file_url": "https://example.com/prescription.pdf",
+                    "uploaded_at": sent_at,
+                    "is_read": rng.random() < 0.7,
+                }
+            )
+        for _ in range(25):
+            history.append(
+                {
+                    "user_id": patient["_id"],
+                    "query": rng.choice(MEDICINES),
+                    "searched_at": now - timedelta(minutes=rng.randrange(10000)),
+                }
+            )
+        for pharmacy in rng.sample(pharmacies, 2):
+            saved.append(
+                {
+                    "user_id": patient["_id"],
+                    "pharmacy_id": pharmacy["_id"],
+                    "saved_at": now,
+                }
+            )
+        carts.append(
+            {
+                "user_id": str(patient["_id"]),
+                "pharmacy_id": str(rng.choice(pharmacies)["_id"]),
+                "items": [],
+            }
+        )
+    database["messages"].insert_many(messages)
+    database["prescriptions"].insert_many(prescriptions)
+    database["user_history"].insert_many(history)
+    database["saved_pharmacies"].insert_many(saved)
+    database["carts"].insert_many(carts)
+    return patients, owners, pharmacies
+
+
+def find(collection, query, sort=None, limit=0):
+    command = {"find": collection, "filter": query, "limit": limit}
+    if sort:
+        command["sort"] = sort
+    return Check(collection, query, command, per_returned=True)
+
+
+def aggregate(collection, match, pipeline, max_ratio=1.5, index_sort=False):
+    command = {"aggregate": collection, "pipeline": pipeline, "cursor": {}}
+    return Check(collection, match, command, max_ratio, index_sort)
+
+
+def count(collection, query):
+    # count_documents runs as an aggregation of $match and $group
+    pipeline = [{"$match": query}, {"$group": {"_id": 1, "n": {"$sum": 1}}}]
+    return aggregate(collection, query, pipeline)
+
+
+def build_checks(patients, owners, pharmacies):
+    now = datetime.now(tz=timezone.utc)
+    patient = patients[0]
+    pharmacy = pharmacies[0]
+    name_filter = build_search_filter("paracetamol")
+    prefix_filter = build_search_filter("parac", prefix=True)
+    category_filter = build_search_filter("", category="antibiotic", max_price=50)
+    basket = {normalize_name(f"{name} 500mg"): 1 for name in MEDICINES[:3]}
+    basket_filter = {
+        "name_key": {"$in": list(basket)},
+        "quantity": {"$gt": 0},
+        "pharmacy": {"$ne": None},
+    }
+    return {
+        "search: by name": aggregate(
+            "inventory",
+            name_filter,
+            build_search_pipeline(name_filter, SearchSort.PRICE_ASC, 0, 20),
+            index_sort=True,
+        ),
+        "search: by name, cut off mid-word": aggregate(
+            "inventory",
+            prefix_filter,
+            build_search_pipeline(prefix_filter, SearchSort.PRICE_ASC, 0, 20),
+        ),
+        "search: by category and price": aggregate(
+            "inventory",
+            category_filter,
+            build_search_pipeline(category_filter, SearchSort.RECENT, 0, 20),
+        ),
+        "search: by category, cheapest first": aggregate(
+            "inventory",
+            category_filter,
+            build_search_pipeline(category_filter, SearchSort.PRICE_ASC, 0, 20),
+            index_sort=True,
+        ),
+        # $geoNear walks outward by distance, so only index use is checked
+        "search: by distance": aggregate(
+            "inventory",
+            name_filter,
+            build_search_pipeline(
+                name_filter, SearchSort.DISTANCE, 0, 20, lat=5.6, lon=-0.2
+            ),
+            max_ratio=None,
+        ),
+        "search: basket": aggregate(
+            "inventory", basket_filter, build_basket_pipeline(basket, 20)
+        ),
+        "public: pharmacy ads": find(
+            "inventory", {"pharmacy_id": pharmacy["_id"], "pharmacy": {"$ne": None}}
+        ),
+        "count: medicines per pharmacy": count(
+            "inventory", {"pharmacy_id": pharmacy["_id"]}
+        ),
+        "inventory: duplicate check on add": count(
+            "inventory",
+            {
+                "$and": [
+                    {"medicine_name": "Paracetamol 500mg"},
+                    {"pharmacy_id": pharmacy["_id"]},
+                ]
+            },
+        ),
+        "inventory: my stock, first page": find(
+            "inventory",
+            build_stock_filter(pharmacy["_id"]),
+            sort={"name_key": 1, "_id": 1},
+            limit=11,
+        ),
+        "inventory: my stock by prefix, next page": find(
+            "inventory",
+            build_stock_filter(
+                pharmacy["_id"], "para", after=("paracetamol 100mg", ObjectId())
+            ),
+            sort={"name_key": 1, "_id": 1},
+            limit=11,
+        ),
+        "inventory: my stock total": count(
+            "inventory", build_stock_filter(pharmacy["_id"], "para")
+        ),
+        "sync: inventory changes since a token": find(
+            "inventory",
+            build_log_filter(
+                "updated_at", (now - timedelta(hours=1), ObjectId("0" * 24)), now
+            ),
+            sort={"updated_at": 1, "_id": 1},
+            limit=201,
+        ),
+        "name index: items changed lately": find(
+            "inventory", {"updated_at": {"$gt": now - timedelta(minutes=5)}}
+        ),
+        "price stats: in-stock listings of a name": find(
+            "inventory",
+            {
+                "name_key": "paracetamol 500mg",
+                "quantity": {"$gt": 0},
+                "pharmacy": {"$ne": None},
+            },
+            sort={"price": 1},
+        ),
+        "low stock: pharmacy list": find(
+            "inventory",
+            {"pharmacy_id": pharmacy["_id"], "low_stock": True},
+            sort={"pharmacy_id": 1, "quantity": 1},
+            limit=100,
+        ),
+        "low stock: items awaiting alerts": find(
+            "inventory", PENDING_ALERT, sort={"updated_at": 1}, limit=500
+        ),
+        "users: login by email": find("users", {"email": patient["email"]}),
+        "public: pharmacies in map bounds": find(
+            "pharmacies", build_bounds_filter(5.6, -0.2, 5.8, 0.0)
+        ),
+        "pharmacies: by owner": find("pharmacies", {"user_id": owners[0]["_id"]}),
+        "messages: pharmacy inbox": find(
+            "messages", {"pharmacy_id": pharmacy["_id"]}, sort={"sent_at": 1}
+        ),
+        "messages: sent by user": find("messages", {"user_id": patient["_id"]}),
+        "prescriptions: pharmacy inbox": find(
+            "prescriptions",
+            {"pharmacy_id": pharmacy["_id"]},
+            sort={"uploaded_at": 1},
+        ),
+        "inbox: unread recount": count(
+            "messages", {"pharmacy_id": pharmacy["_id"], "is_read": False}
+        ),
+        "profile: search history page": find(
+            "user_history",
+            {"user_id": patient["_id"]},
+            sort={"searched_at": -1},
+            limit=20,
+        ),
+        "saved: pharmacies of user": find(
+            "saved_pharmacies", {"user_id": patient["_id"]}
+        ),
+        "cart: by user": find("carts", {"user_id": str(patient["_id"])}),
+        "cascade: carts of pharmacy": find(
+            "carts", {"pharmacy_id": str(pharmacy["_id"])}, limit=500
+        ),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--uri",
+        default=os.getenv("QUERY_PLAN_MONGO_URI", "mongodb://localhost:27017"),
+    )
+    parser.add_argument("--db", default="medifind_query_plans")
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the seeded database afterwards"
+    )
+    args = parser.parse_args(argv)
+
+    client = MongoClient(args.uri)
+    client.drop_database(args.db)
+    database = client[args.db]
+    try:
+        ensure_indexes(database)
+        checks = build_checks(*seed(database, random.Random(42)))
+        failures = 0
+        for name, check in checks.items():
+            problems, stages, examined, keys, needed = evaluate(database, check)
+            failures += bool(problems)
+            print(
+                f"{'FAIL' if problems else 'ok':4}  {name:40} "
+                f"{examined:>6} docs / {keys:>6} keys / {needed:<6} needed  "
+                f"{','.join(sorted(stages))}"
+            )
+            for problem in problems:
+                print(f"      {problem}")
+    finally:
+        if not args.keep:
+            client.drop_database(args.db)
+        client.close()
+    print(f"{len(checks) - failures}/{len(checks)} queries use their indexes")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
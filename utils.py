@@ -1,4 +1,76 @@
+import base64
+import json
+from bson import ObjectId
+
+
 def replace_mongo_id(doc):
     doc["id"] = str(doc["_id"])
     del doc["_id"]
     return doc
+
+
+def normalize_name(name):
+    # Case- and whitespace-insensitive key for medicine names
+    return " ".join(str(name).lower().split())
+
+
+def name_tokens(name):
+    # Distinct words of the normalized name, which search matches whole
+    return list(dict.fromkeys(normalize_name(name).split()))
+
+
+def geo_point(gps_location):
+    # GeoJSON point for 2dsphere indexes; gps_location is {"lat", "lon"}
+    if not gps_location or gps_location.get("lat") is None:
+        return None
+    return {
+        "type": "Point",
+        "coordinates": [gps_location["lon"], gps_location["lat"]],
+    }
+
+
+def pharmacy_summary(pharmacy):
+    # Pharmacy fields embedded next to each inventory item for reads
+    return {
+        "pharmacy_name": pharmacy.get("pharmacy_name"),
+        "digital_address": pharmacy.get("digital_address"),
+        "gps_location": pharmacy.get("gps_location"),
+        "location": geo_point(pharmacy.get("gps_location")),
+    }
+
+
+def format_inventory_item(med):
+    # Public fields of an inventory document; keys kept for indexing,
+    # alerts and sync (name_key, low_stock, the GeoJSON point...) stay out
+    pharmacy = med.get("pharmacy") or {}
+    return {
+        "id": str(med["_id"]),
+        "pharmacy_id": str(med["pharmacy_id"]),
+        "medicine_name": med.get("medicine_name"),
+        "quantity": med.get("quantity"),
+        "price": med.get("price"),
+        "description": med.get("description"),
+        "category": med.get("category"),
+        "flyer": med.get("flyer"),
+        "updated_at": med.get("updated_at"),
+        "pharmacy": {
+            "pharmacy_name": pharmacy.get("pharmacy_name"),
+            "digital_address": pharmacy.get("digital_address"),
+            "gps_location": pharmacy.get("gps_location"),
+        },
+    }
+
+
+def encode_cursor(name_key, doc_id):
+    # Opaque keyset cursor: the sort key and _id of the last item returned
+    raw = json.dumps([name_key, str(doc_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    # Raises ValueError when the cursor was not produced by encode_cursor
+    try:
+        name_key, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return name_key, ObjectId(doc_id)
+    except Exception as error:
+        raise ValueError("Invalid cursor") from error